@@ -0,0 +1,111 @@
+"""Cold start benchmark for RAGChatAgent.
+
+Measures, each in a fresh interpreter, how long it takes to import
+`rag_chat_agent.agent`, construct a RAGChatAgent and prewarm it. The median of
+`--runs` runs is compared against a budget per stage and the script exits
+with status 1 if any stage is over budget, so it can gate CI.
+
+Nothing is sent to AWS while the agent is built, so placeholder settings and
+credentials are used for any variable that isn't set. Run with e.g.
+
+    uv run python benchmark_cold_start.py --runs 5 --import-budget 0.5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PLACEHOLDER_ENV = {
+    "AWS_ACCESS_KEY_ID": "benchmark",
+    "AWS_SECRET_ACCESS_KEY": "benchmark",
+    "AWS_DEFAULT_REGION": "eu-west-2",
+    "DATA_REGION": "eu-west-2",
+    "LLM_REGION": "eu-west-2",
+    "COLLECTION_URL": "https://benchmark.eu-west-2.aoss.amazonaws.com",
+    "INDEX_NAME": "benchmark",
+    "EMBEDDING_MODEL": "amazon.titan-embed-text-v2:0",
+    "LLM_MODEL": "anthropic.claude-3-haiku-20240307-v1:0",
+    "SESSION_HISTORY": "benchmark-sessions",
+    "RATING_HISTORY": "benchmark-ratings",
+    "GUARDRAILS": "benchmark",
+    "GUARDRAILS_VERSION": "1",
+}
+
+MEASURE = """
+import json, time
+start = time.perf_counter()
+from rag_chat_agent.agent import RAGChatAgent
+imported = time.perf_counter()
+agent = RAGChatAgent()
+initialised = time.perf_counter()
+agent.prewarm()
+prewarmed = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "init": initialised - imported,
+    "prewarm": prewarmed - initialised,
+}))
+"""
+
+
+def measure_once(env: dict) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        sys.exit(f"Benchmark run failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument(
+        "--import-budget",
+        type=float,
+        default=0.75,
+        help="seconds allowed to import rag_chat_agent.agent",
+    )
+    parser.add_argument(
+        "--init-budget",
+        type=float,
+        default=0.05,
+        help="seconds allowed to construct RAGChatAgent",
+    )
+    parser.add_argument(
+        "--prewarm-budget",
+        type=float,
+        default=5.0,
+        help="seconds allowed for RAGChatAgent.prewarm",
+    )
+    args = parser.parse_args()
+
+    env = {**PLACEHOLDER_ENV, **os.environ}
+    src = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [src, env.get("PYTHONPATH")]))
+
+    runs = [measure_once(env) for _ in range(args.runs)]
+    budgets = {
+        "import": args.import_budget,
+        "init": args.init_budget,
+        "prewarm": args.prewarm_budget,
+    }
+
+    failed = False
+    for stage, budget in budgets.items():
+        median = statistics.median(run[stage] for run in runs)
+        status = "ok" if median <= budget else "OVER BUDGET"
+        failed |= median > budget
+        print(f"{stage:<8} {median:7.3f}s  (budget {budget:.3f}s)  {status}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
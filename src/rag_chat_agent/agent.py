@@ -1,19 +1,12 @@
 import json
 import logging
+import os
+import threading
 import time
 
-from langchain.agents import AgentExecutor, create_structured_chat_agent
-from langchain_core.runnables.history import RunnableWithMessageHistory
-
-from .aws.bedrock import BedrockHandler
-from .aws.dynamodb import DynamoDBHandler
-from .aws.guardrails import GuardrailsHandler
-from .aws.opensearch import OpenSearchHandler
+from .aws.dynamodb import DynamoDBHandler, current_session_id
+from .aws.resilience import turn_deadline
 from .config import Config
-from .prompts.prompt_templates import get_agent_prompt
-from .tools.python_repl import PythonREPLTool
-from .tools.rating import RatingTool
-from .tools.retriever import RetrieverTool
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +28,11 @@ def normalise_response(response):
     elif isinstance(output, str):
         # Keep it as-is if it's already a string
         normalized_response["output"] = output
+    elif isinstance(output, list):
+        # Native tool calling models can answer with a list of content blocks
+        normalized_response["output"] = "".join(
+            block.get("text", "") for block in output if isinstance(block, dict)
+        )
     else:
         # Handle unexpected types (e.g., raise an error or log)
         raise ValueError(
@@ -47,82 +45,165 @@ def normalise_response(response):
 class RAGChatAgent:
     def __init__(
         self,
-        tokenID: str,
+        tokenID: str | None = None,
         custom_prompt_path: str | None = None,
         model_kwargs: None | dict = None,
+        config: Config | None = None,
     ):
         start_time = time.time()
         logger.info("AskOps Start")
-        self.config = Config()
+        self.config = config or Config()
         self.model_kwargs = model_kwargs
-        self.tokenID = tokenID
+        self._tokenID = tokenID
         self.custom_prompt_path = custom_prompt_path
 
-        # 1) DynamoDB
-        init_start = time.time()
-        self.dynamodb = DynamoDBHandler(self.config)
+        # Handlers and tools are built on first use, so a cold start only pays
+        # for what the first request needs. Call prewarm() to build them up front.
+        self._components = {}
+        self._build_lock = threading.RLock()
+
         logger.info(
-            f"[TIMING] DynamoDBHandler init took {time.time() - init_start:.2f}s"
+            f"RAGChatAgent __init__ completed. Total init time: {time.time() - start_time:.2f}s"
         )
 
-        # 2) Bedrock
-        init_start = time.time()
-        self.bedrock = BedrockHandler(self.config, self.model_kwargs)
-        logger.info(
-            f"[TIMING] BedrockHandler init took {time.time() - init_start:.2f}s"
+    def _component(self, name: str, build):
+        component = self._components.get(name)
+        if component is None:
+            with self._build_lock:
+                component = self._components.get(name)
+                if component is None:
+                    init_start = time.time()
+                    component = build()
+                    self._components[name] = component
+                    logger.info(
+                        f"[TIMING] {name} init took {time.time() - init_start:.2f}s"
+                    )
+        return component
+
+    @property
+    def tool_calling(self) -> bool:
+        return self.config.AGENT_MODE == "tool_calling"
+
+    @property
+    def dynamodb(self):
+        return self._component("dynamodb", lambda: DynamoDBHandler(self.config))
+
+    @property
+    def bedrock(self):
+        from .aws.bedrock import BedrockHandler
+
+        return self._component(
+            "bedrock", lambda: BedrockHandler(self.config, self.model_kwargs)
         )
 
-        # 3) OpenSearch
-        init_start = time.time()
-        self.opensearch = OpenSearchHandler(self.config)
-        logger.info(
-            f"[TIMING] OpenSearchHandler init took {time.time() - init_start:.2f}s"
+    @property
+    def opensearch(self):
+        from .aws.opensearch import OpenSearchHandler
+
+        return self._component("opensearch", lambda: OpenSearchHandler(self.config))
+
+    @property
+    def guardrails(self):
+        from .aws.guardrails import GuardrailsHandler
+
+        return self._component("guardrails", lambda: GuardrailsHandler(self.config))
+
+    @property
+    def retriever(self):
+        from .tools.retriever import RetrieverTool
+
+        return self._component(
+            "retriever",
+            lambda: RetrieverTool(
+                self.opensearch,
+                cache_ttl=self.config.RETRIEVAL_CACHE_TTL,
+                cache_size=self.config.RETRIEVAL_CACHE_SIZE,
+            ),
         )
 
-        # 4) Tools
-        init_start = time.time()
-        self.retriever = RetrieverTool(self.opensearch)
-        self.python_repl = PythonREPLTool()
-        self.rating_tool = RatingTool(self.dynamodb)
-
-        self.tools = [
-            self.retriever.get_tool(),
-            # self.python_repl.get_tool(),
-            self.rating_tool.get_tool(),
-        ]
-
-        logger.info(f"[TIMING] Tools init took {time.time() - init_start:.2f}s")
-
-        # 5) LLM
-        init_start = time.time()
-        self.llm = self.bedrock.get_llm()
-        logger.info(f"[TIMING] get_llm took {time.time() - init_start:.2f}s")
-
-        # 6) Agent Prompt
-        init_start = time.time()
-        self.prompt = get_agent_prompt(custom_prompt_path=self.custom_prompt_path)
-        logger.info(f"[TIMING] get_agent_prompt took {time.time() - init_start:.2f}s")
-
-        # 7) Agent Executor
-        init_start = time.time()
-        self.agent_executor = self.set_agent_executor()
-        logger.info(f"[TIMING] set_agent_executor took {time.time() - init_start:.2f}s")
-
-        # 8) Guardrails
-        init_start = time.time()
-        self.guardrails = GuardrailsHandler(self.config)
-        logger.info(
-            f"[TIMING] GuardrailsHandler init took {time.time() - init_start:.2f}s"
+    @property
+    def python_repl(self):
+        from .tools.python_repl import PythonREPLTool
+        from .tools.sandbox import get_sandbox_pool
+
+        # signal based timeouts only work on the main thread, so the python tool
+        # is only offered when it can run in sandbox worker processes.
+        repl_workers = self.config.PYTHON_REPL_WORKERS
+        return self._component(
+            "python_repl",
+            lambda: PythonREPLTool(
+                sandbox=get_sandbox_pool(size=repl_workers) if repl_workers else None
+            ),
         )
 
-        logger.info(
-            f"RAGChatAgent __init__ completed. Total init time: {time.time() - start_time:.2f}s"
+    @property
+    def rating_tool(self):
+        from .tools.rating import RatingTool
+
+        return self._component("rating_tool", lambda: RatingTool(self.dynamodb))
+
+    @property
+    def tools(self):
+        def build():
+            tools = [self.retriever.get_tool(), self.rating_tool.get_tool()]
+            if self.config.PYTHON_REPL_WORKERS:
+                tools.insert(1, self.python_repl.get_tool())
+            return tools
+
+        return self._component("tools", build)
+
+    @property
+    def llm(self):
+        return self._component(
+            "llm", lambda: self.bedrock.get_llm(tool_calling=self.tool_calling)
+        )
+
+    @property
+    def prompt(self):
+        from .prompts.prompt_templates import get_agent_prompt
+
+        return self._component(
+            "prompt",
+            lambda: get_agent_prompt(
+                custom_prompt_path=self.custom_prompt_path,
+                tool_calling=self.tool_calling,
+            ),
         )
 
+    @property
+    def agent_executor(self):
+        return self._component("agent_executor", self.set_agent_executor)
+
+    def prewarm(self):
+        """Build every handler and tool now rather than on first use.
+
+        Meant for the Lambda init phase, e.g. at module level in the handler
+        file, so the first invocation doesn't pay for it.
+        """
+        start_time = time.time()
+        self.agent_executor
+        self.guardrails
+        logger.info(f"[TIMING] prewarm took {time.time() - start_time:.2f}s")
+        return self
+
+    @property
+    def tokenID(self):
+        """The session of the turn being run, or the agent's default session."""
+        return current_session_id.get() or self._tokenID
+
     def set_agent_executor(self, verbose=False, handle_parse=True):
-        logger.info("Setting up agent executor")
+        from langchain.agents import (
+            AgentExecutor,
+            create_structured_chat_agent,
+            create_tool_calling_agent,
+        )
+
+        logger.info(f"Setting up {self.config.AGENT_MODE} agent executor")
         try:
-            agent = create_structured_chat_agent(self.llm, self.tools, self.prompt)
+            if self.tool_calling:
+                agent = create_tool_calling_agent(self.llm, self.tools, self.prompt)
+            else:
+                agent = create_structured_chat_agent(self.llm, self.tools, self.prompt)
             logger.debug("Structured chat agent created")
 
             executor = AgentExecutor(
@@ -137,7 +218,45 @@ class RAGChatAgent:
             logger.error(f"Error setting up agent executor: {str(e)}")
             raise
 
-    def invoke_agent(self, query):
+    def invoke_agent(self, query, tokenID: str | None = None, callbacks=None):
+        """Run one turn for the session `tokenID`, or the agent's own session.
+
+        Passing `tokenID` lets one agent serve many sessions concurrently.
+        `callbacks` are langchain callback handlers for the agent run.
+        """
+        from .tools.retriever import turn_memo
+
+        session = current_session_id.set(tokenID or self._tokenID)
+        try:
+            # Retries of AWS calls made during this turn must finish within the turn.
+            with turn_deadline(self.config.TURN_TIMEOUT), turn_memo():
+                return self._invoke_agent(query, callbacks)
+        finally:
+            current_session_id.reset(session)
+            self._flush_if_lambda()
+
+    def rate_conversation(self, rating: str, tokenID: str | None = None):
+        """Store a rating for the session `tokenID` outside of the agent loop."""
+        session = current_session_id.set(tokenID or self._tokenID)
+        try:
+            return self.rating_tool.rate_conversation(rating)
+        finally:
+            current_session_id.reset(session)
+            self._flush_if_lambda()
+
+    def flush(self, timeout: float | None = 10) -> bool:
+        """Wait for queued background writes, such as ratings, to finish."""
+        from .aws.batch_writer import flush_batch_writers
+
+        return flush_batch_writers(timeout)
+
+    def _flush_if_lambda(self):
+        # Lambda freezes the process between invocations, so writes still
+        # queued when the handler returns could be delayed or lost.
+        if os.getenv("AWS_LAMBDA_FUNCTION_NAME"):
+            self.flush()
+
+    def _invoke_agent(self, query, callbacks=None):
         overall_start = time.time()
         logger.info(f"Starting invoke_agent for session {self.tokenID}")
 
@@ -169,9 +288,17 @@ class RAGChatAgent:
             return guardrail_check_input.get("outputs", [])[0].get("text")
 
         else:
-            config = {"configurable": {"session_id": self.tokenID}}
+            from .metrics import TurnMetrics
+
+            metrics = TurnMetrics()
+            config = {
+                "configurable": {"session_id": self.tokenID},
+                "callbacks": [metrics, *(callbacks or [])],
+            }
             step_start = time.time()
 
+            from langchain_core.runnables.history import RunnableWithMessageHistory
+
             agent_with_chat_history = RunnableWithMessageHistory(
                 self.agent_executor,
                 self.dynamodb.get_chat_history,
@@ -196,6 +323,10 @@ class RAGChatAgent:
             logger.info(
                 f"[TIMING] agent invocation took {time.time() - step_start:.2f}s"
             )
+            logger.info(
+                f"[METRICS] agent_mode={self.config.AGENT_MODE} "
+                + " ".join(f"{k}={v}" for k, v in metrics.as_dict().items())
+            )
 
             response = normalise_response(response)
 
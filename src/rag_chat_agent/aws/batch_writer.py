@@ -0,0 +1,171 @@
+import atexit
+import logging
+import queue
+import random
+import threading
+import time
+
+from boto3.dynamodb.types import TypeSerializer
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = 25
+"""the most items batch_write_item accepts in one call"""
+
+_FLUSH = object()
+_CLOSE = object()
+
+
+class BatchWriter:
+    """Writes items to a DynamoDB table from a background thread.
+
+    `put` only queues the item, so callers never wait on DynamoDB. Items
+    are sent with batch_write_item in batches of up to 25, retrying any
+    the service leaves unprocessed. An item may be queued with a `resolve`
+    callable, run on the writer thread just before the item is sent, for
+    fields that are too slow to work out on the caller's thread.
+    """
+
+    def __init__(
+        self,
+        client,
+        table_name: str,
+        flush_interval: float = 1.0,
+        max_attempts: int = 5,
+    ):
+        logger.info(f"Starting BatchWriter for table {table_name}")
+        self.client = client
+        self.table_name = table_name
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.serializer = TypeSerializer()
+        self.queue = queue.Queue()
+        self.pending = 0
+        self.condition = threading.Condition()
+        self.closed = False
+        self.thread = threading.Thread(
+            target=self._run, name=f"batch-writer-{table_name}", daemon=True
+        )
+        self.thread.start()
+
+    def put(self, item: dict, resolve=None):
+        if self.closed:
+            raise RuntimeError(f"BatchWriter for {self.table_name} has been closed")
+        with self.condition:
+            self.pending += 1
+        self.queue.put((item, resolve))
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Wait until every queued item has been written or given up on.
+
+        Returns False if items were still pending after `timeout` seconds.
+        """
+        # Wakes the writer so a part filled batch is sent without waiting.
+        self.queue.put(_FLUSH)
+        with self.condition:
+            done = self.condition.wait_for(lambda: self.pending == 0, timeout)
+        if not done:
+            logger.warning(
+                f"{self.pending} items still pending for {self.table_name} after flush"
+            )
+        return done
+
+    def close(self, timeout: float | None = 10):
+        self.flush(timeout)
+        self.closed = True
+        self.queue.put(_CLOSE)
+
+    def _next_batch(self) -> list | None:
+        batch = []
+        deadline = None
+        while len(batch) < MAX_BATCH_SIZE:
+            if deadline is None:
+                entry = self.queue.get()
+            else:
+                try:
+                    entry = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+            if entry is _CLOSE:
+                if batch:
+                    # Put the sentinel back so the loop stops after this batch.
+                    self.queue.put(_CLOSE)
+                    break
+                return None
+            if entry is _FLUSH:
+                if batch:
+                    break
+                continue
+            batch.append(entry)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.exception(
+                    f"Failed to write {len(batch)} items to {self.table_name}: {str(e)}"
+                )
+            finally:
+                with self.condition:
+                    self.pending -= len(batch)
+                    self.condition.notify_all()
+
+    def _prepare(self, item: dict, resolve) -> dict:
+        if resolve is not None:
+            try:
+                item = resolve(item)
+            except Exception as e:
+                logger.error(f"Failed to resolve item for {self.table_name}: {str(e)}")
+        return {k: self.serializer.serialize(v) for k, v in item.items()}
+
+    def _write(self, batch: list):
+        requests = [
+            {"PutRequest": {"Item": self._prepare(item, resolve)}}
+            for item, resolve in batch
+        ]
+        for attempt in range(self.max_attempts):
+            response = self.client.batch_write_item(
+                RequestItems={self.table_name: requests}
+            )
+            requests = response.get("UnprocessedItems", {}).get(self.table_name, [])
+            if not requests:
+                logger.debug(f"Wrote {len(batch)} items to {self.table_name}")
+                return
+            time.sleep(random.uniform(0, 0.1 * 2**attempt))
+        logger.error(
+            f"Gave up on {len(requests)} unprocessed items for {self.table_name}"
+        )
+
+
+_writers: dict[str, BatchWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_batch_writer(client, table_name: str) -> BatchWriter:
+    """Return the process-wide BatchWriter for `table_name`."""
+    with _writers_lock:
+        if table_name not in _writers:
+            _writers[table_name] = BatchWriter(client, table_name)
+        return _writers[table_name]
+
+
+def flush_batch_writers(timeout: float | None = 10) -> bool:
+    """Flush every BatchWriter, e.g. before a Lambda invocation returns."""
+    with _writers_lock:
+        writers = list(_writers.values())
+    return all([writer.flush(timeout) for writer in writers])
+
+
+@atexit.register
+def _close_batch_writers():
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer.close()
@@ -1,15 +1,114 @@
+import json
 import logging
+from functools import lru_cache
+from typing import Any, Iterator, List, Optional, Sequence
 
-from langchain_aws import ChatBedrock
+from langchain_aws import ChatBedrock, ChatBedrockConverse
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from .resilience import get_adaptive_boto_config
+from .routing import LLMEndpoint, get_router, parse_endpoints
 
 logger = logging.getLogger(__name__)
 
 
+class RoutedChatBedrock(BaseChatModel):
+    """Chat model that sends each call to the healthiest endpoint in a pool.
+
+    Calls fail over to the next endpoint on throttling or other retryable
+    errors. Streamed calls can only fail over before the first chunk.
+    """
+
+    llms: List[Any]
+    """ChatBedrock instances, in the same order as the router's endpoints"""
+    router: Any
+    """the LLMRouter that decides which endpoint to use"""
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed-amazon-bedrock-chat"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return self.router.call(
+            lambda i: self.llms[i]._generate(
+                messages, stop=stop, run_manager=run_manager, **kwargs
+            )
+        )
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        def start(i):
+            stream = self.llms[i]._stream(
+                messages, stop=stop, run_manager=run_manager, **kwargs
+            )
+            return next(stream, None), stream
+
+        first, stream = self.router.call(start)
+        if first is not None:
+            yield first
+            yield from stream
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        # Every endpoint serves the same family of model, so the first one's
+        # formatting of the tools is bound here and passed to whichever is used.
+        bound = self.llms[0].bind_tools(tools, **kwargs)
+        return self.bind(**bound.kwargs)
+
+
+@lru_cache(maxsize=None)
+def _get_chat_bedrock(
+    region: str, model_id: str, model_kwargs_json: str, max_attempts: int
+) -> ChatBedrock:
+    # Shared by every handler calling the same model with the same settings.
+    return ChatBedrock(
+        model_id=model_id,
+        region_name=region,
+        model_kwargs=json.loads(model_kwargs_json),
+        config=get_adaptive_boto_config(max_attempts=max_attempts),
+    )
+
+
+@lru_cache(maxsize=None)
+def _get_chat_bedrock_converse(
+    region: str, model_id: str, model_kwargs_json: str, max_attempts: int
+) -> ChatBedrockConverse:
+    # The Converse API only takes the common inference parameters.
+    model_kwargs = {
+        k: v
+        for k, v in (json.loads(model_kwargs_json) or {}).items()
+        if k in ("stop_sequences", "max_tokens", "temperature", "top_p")
+    }
+    return ChatBedrockConverse(
+        model=model_id,
+        region_name=region,
+        config=get_adaptive_boto_config(max_attempts=max_attempts),
+        **model_kwargs,
+    )
+
+
 class BedrockHandler:
     def __init__(self, config, model_kwargs: None | dict = None):
         logger.info("Initializing BedrockHandler")
         self.region = config.LLM_REGION
         self.model_id = config.LLM_MODEL
+        self.endpoints = parse_endpoints(config.LLM_ENDPOINTS) or [
+            LLMEndpoint(self.region, self.model_id)
+        ]
+        self.router = get_router(self.endpoints)
 
         if model_kwargs and not isinstance(model_kwargs, dict):
             logger.error("model_kwargs should be a dict[str]")
@@ -19,17 +118,38 @@ class BedrockHandler:
 
         logger.debug(f"LLM Region: {self.region}")
         logger.debug(f"LLM Model ID: {self.model_id}")
+        logger.debug(f"LLM Endpoints: {[e.name for e in self.endpoints]}")
+
+    def get_llm(self, tool_calling: bool = False):
+        """Chat model routed over the endpoint pool.
 
-    def get_llm(self):
+        With `tool_calling` the model uses the Converse API, which takes tool
+        schemas natively through `bind_tools`.
+        """
         logger.info("Creating ChatBedrock LLM instance")
+        get_chat_model = (
+            _get_chat_bedrock_converse if tool_calling else _get_chat_bedrock
+        )
+        # With somewhere to fail over to, don't spend long retrying one region.
+        max_attempts = 4 if len(self.endpoints) == 1 else 2
         try:
-            llm = ChatBedrock(
-                model_id=self.model_id,
-                region_name=self.region,
-                model_kwargs=self.model_kwargs,
-            )
+            model_kwargs_json = json.dumps(self.model_kwargs, sort_keys=True)
+            llms = [
+                get_chat_model(
+                    endpoint.region,
+                    endpoint.model_id,
+                    model_kwargs_json,
+                    max_attempts,
+                )
+                for endpoint in self.endpoints
+            ]
+            llm = RoutedChatBedrock(llms=llms, router=self.router)
             logger.info("Successfully created ChatBedrock LLM instance")
             return llm
         except Exception as e:
             logger.error(f"Error creating ChatBedrock LLM instance: {str(e)}")
             raise
+
+    def get_endpoint_stats(self) -> list[dict]:
+        """Health of each LLM endpoint as seen by this process."""
+        return self.router.stats()
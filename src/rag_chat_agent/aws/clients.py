@@ -0,0 +1,28 @@
+import logging
+from functools import lru_cache
+
+import boto3
+
+from .resilience import get_boto_config
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_client(
+    service_name: str, region_name: str | None = None, read_timeout: int | None = None
+):
+    """Return a boto3 client shared by every handler in the process.
+
+    Clients are thread safe and expensive to build, so handlers for
+    different tenants reuse one per service, region and timeout.
+    `read_timeout` gives the client our resilience config, None keeps
+    boto3's defaults.
+    """
+    logger.info(f"Creating shared {service_name} client for region {region_name}")
+    kwargs = {}
+    if region_name:
+        kwargs["region_name"] = region_name
+    if read_timeout:
+        kwargs["config"] = get_boto_config(read_timeout=read_timeout)
+    return boto3.client(service_name, **kwargs)
@@ -0,0 +1,125 @@
+import hashlib
+import random
+import re
+import threading
+from collections import defaultdict
+
+_WORD = re.compile(r"\w+")
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def content_hash(text: str) -> str:
+    """Hash of a chunk's text, ignoring differences in whitespace."""
+    return hashlib.sha256(" ".join(text.split()).encode()).hexdigest()
+
+
+def _shingle_hash(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest())
+
+
+class MinHasher:
+    """MinHash signatures over word shingles, banded for LSH lookups.
+
+    With the defaults (64 permutations in 16 bands of 4) two chunks share at
+    least one band with high probability once their Jaccard similarity is
+    above about 0.5; candidates are then confirmed against `threshold`.
+    """
+
+    def __init__(
+        self,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle_size: int = 5,
+        threshold: float = 0.9,
+        seed: int = 1,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        # Fixed seed, signatures stored in the index must stay comparable.
+        rng = random.Random(seed)
+        self.permutations = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def _shingles(self, text: str) -> set[int]:
+        words = _WORD.findall(text.lower())
+        if len(words) <= self.shingle_size:
+            return {_shingle_hash(" ".join(words))}
+        return {
+            _shingle_hash(" ".join(words[i : i + self.shingle_size]))
+            for i in range(len(words) - self.shingle_size + 1)
+        }
+
+    def signature(self, text: str) -> list[int]:
+        shingles = self._shingles(text)
+        return [
+            min((a * s + b) % _MERSENNE_PRIME for s in shingles)
+            for a, b in self.permutations
+        ]
+
+    def band_keys(self, signature: list[int]) -> list[str]:
+        keys = []
+        for band in range(self.bands):
+            rows = signature[band * self.rows : (band + 1) * self.rows]
+            digest = hashlib.blake2b(repr(rows).encode(), digest_size=8).hexdigest()
+            keys.append(f"{band}:{digest}")
+        return keys
+
+    @staticmethod
+    def similarity(a: list[int], b: list[int]) -> float:
+        """Estimated Jaccard similarity of the texts behind two signatures."""
+        return sum(x == y for x, y in zip(a, b)) / len(a)
+
+    def is_duplicate(self, a: list[int], b: list[int]) -> bool:
+        return self.similarity(a, b) >= self.threshold
+
+
+class LSHIndex:
+    """In-memory, thread safe LSH index of MinHash signatures."""
+
+    def __init__(self, hasher: MinHasher):
+        self.hasher = hasher
+        self.buckets = defaultdict(set)
+        self.signatures = {}
+        self.lock = threading.Lock()
+
+    def find_duplicate(self, signature: list[int]) -> str | None:
+        with self.lock:
+            return self._find_duplicate(signature)
+
+    def _find_duplicate(self, signature: list[int]) -> str | None:
+        candidates = set()
+        for band_key in self.hasher.band_keys(signature):
+            candidates |= self.buckets.get(band_key, set())
+        for key in candidates:
+            if self.hasher.is_duplicate(signature, self.signatures[key]):
+                return key
+        return None
+
+    def add(self, key: str, signature: list[int]):
+        with self.lock:
+            self._add(key, signature)
+
+    def _add(self, key: str, signature: list[int]):
+        self.signatures[key] = signature
+        for band_key in self.hasher.band_keys(signature):
+            self.buckets[band_key].add(key)
+
+    def add_if_unique(self, key: str, signature: list[int]) -> str | None:
+        """Add the signature unless it duplicates one already indexed.
+
+        Returns the key of the existing duplicate, or None if it was added.
+        Checking and adding happen under one lock so concurrent callers
+        can't both add near-identical chunks.
+        """
+        with self.lock:
+            duplicate = self._find_duplicate(signature)
+            if duplicate is None:
+                self._add(key, signature)
+            return duplicate
@@ -1,22 +1,28 @@
 import logging
+import threading
+from contextvars import ContextVar
 
 import boto3
 from botocore.exceptions import ClientError
-from langchain_community.chat_message_histories import DynamoDBChatMessageHistory
+
+from .batch_writer import get_batch_writer
+from .clients import get_client
 
 logger = logging.getLogger(__name__)
 
+current_session_id: ContextVar[str | None] = ContextVar(
+    "current_session_id", default=None
+)
+"""the session the running agent turn belongs to, set by RAGChatAgent.invoke_agent"""
+
 
 class DynamoDBHandler:
     def __init__(self, config):
         logger.info("Initializing DynamoDBHandler")
-        self.dynamodb = boto3.resource("dynamodb")
-        self.dynamodb_client = boto3.client("dynamodb")
+        self._local = threading.local()
+        self.dynamodb_client = get_client("dynamodb")
         self.session_history_table = config.SESSION_HISTORY
         self.rating_history_table = config.RATING_HISTORY
-        self.tokenID = (
-            None  # This is only needed for chat history, set with get_chat-history
-        )
         self.collection_url = config.COLLECTION_URL
         self.index_name = config.INDEX_NAME
         self.embedding_model = config.EMBEDDING_MODEL
@@ -25,6 +31,22 @@ class DynamoDBHandler:
         logger.debug(f"Session History Table: {self.session_history_table}")
         logger.debug(f"Rating History Table: {self.rating_history_table}")
 
+    @property
+    def dynamodb(self):
+        # boto3 resources aren't thread safe, so each thread gets its own.
+        if not hasattr(self._local, "resource"):
+            self._local.resource = boto3.resource("dynamodb")
+        return self._local.resource
+
+    @property
+    def tokenID(self):
+        # Per turn rather than per handler, so one handler can serve many sessions.
+        return current_session_id.get()
+
+    @tokenID.setter
+    def tokenID(self, tokenID):
+        current_session_id.set(tokenID)
+
     def table_exists(self, table_name: str):
         logger.info(f"Checking if table '{table_name}' exists")
         try:
@@ -43,7 +65,21 @@ class DynamoDBHandler:
         table = self.dynamodb.Table(table_name)
         return table.put_item(Item=item)
 
+    def put_item_async(self, table_name: str, item: dict, resolve=None):
+        """Queue `item` for a background batch write and return straight away.
+
+        See BatchWriter for `resolve`. Queued items are written by
+        flush_batch_writers, at the latest when the process exits.
+        """
+        get_batch_writer(self.dynamodb_client, table_name).put(item, resolve)
+
     def get_chat_history(self, tokenID: str):
+        # Imported here as langchain_community is slow to import, and the
+        # handler is also used on paths that never read the history.
+        from langchain_community.chat_message_histories import (
+            DynamoDBChatMessageHistory,
+        )
+
         logger.info(f"Getting chat history for tokenID: {tokenID}")
         if tokenID is None:
             logger.error("tokenID is None. Cannot retrieve chat history.")
@@ -1,17 +1,131 @@
 import json
 import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 
-import boto3
+from .clients import get_client
+from .prefilter import INTERVENED, InputPrefilter
+from .resilience import get_caller
 
 logger = logging.getLogger(__name__)
 
+_PARAGRAPH_BREAK = re.compile(r"(?<=\n\n)")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+
+# Shared by every handler, segments of one answer are checked concurrently.
+_segment_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="guardrail")
+
+
+def _pieces(text: str, max_chars: int):
+    """Yield paragraphs, falling back to sentences and then hard cuts for long ones."""
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        if len(paragraph) <= max_chars:
+            yield paragraph
+            continue
+        start = 0
+        for match in _SENTENCE_BREAK.finditer(paragraph):
+            yield paragraph[start : match.end()]
+            start = match.end()
+        sentence = paragraph[start:]
+        for i in range(0, len(sentence), max_chars):
+            yield sentence[i : i + max_chars]
+
+
+def split_segments(text: str, max_chars: int) -> list[str]:
+    """Split text into segments of at most `max_chars`, on paragraph or sentence
+    boundaries where possible.
+
+    Whitespace is kept with the segments, so `"".join(segments) == text`.
+    """
+    segments = []
+    current = ""
+    for piece in _pieces(text, max_chars):
+        while len(piece) > max_chars:
+            # Only a sentence longer than max_chars gets here.
+            if current:
+                segments.append(current)
+                current = ""
+            segments.append(piece[:max_chars])
+            piece = piece[max_chars:]
+        if len(current) + len(piece) > max_chars:
+            segments.append(current)
+            current = ""
+        current += piece
+    if current or not segments:
+        segments.append(current)
+    return segments
+
+
+def _is_blocked(value) -> bool:
+    """True if any assessment in a guardrail response blocked rather than masked."""
+    if isinstance(value, dict):
+        if value.get("action") == "BLOCKED":
+            return True
+        return any(_is_blocked(v) for v in value.values())
+    if isinstance(value, list):
+        return any(_is_blocked(v) for v in value)
+    return False
+
+
+def combine_segment_responses(segments: list[str], responses: list[dict]) -> dict:
+    """Merge per segment apply_guardrail responses into one response.
+
+    If any segment was blocked, that segment's response is returned, as its
+    output is the guardrail's blocked message. If segments were only
+    masked, the masked segments are stitched back together with the
+    untouched ones. `triggeredSegments` lists the segments that intervened.
+    """
+    triggered = [
+        i for i, response in enumerate(responses) if response["action"] == INTERVENED
+    ]
+    if not triggered:
+        combined = dict(responses[0])
+        combined["assessments"] = [
+            a for response in responses for a in response.get("assessments", [])
+        ]
+        combined["triggeredSegments"] = []
+        return combined
+
+    for i in triggered:
+        if _is_blocked(responses[i].get("assessments", [])):
+            logger.info(f"Guardrail blocked output segment {i}")
+            combined = dict(responses[i])
+            combined["triggeredSegments"] = triggered
+            return combined
+
+    logger.info(f"Guardrail masked output segments {triggered}")
+    text = "".join(
+        response["outputs"][0]["text"]
+        if response["action"] == INTERVENED and response.get("outputs")
+        else segment
+        for segment, response in zip(segments, responses)
+    )
+    combined = dict(responses[triggered[0]])
+    combined["outputs"] = [{"text": text}]
+    combined["assessments"] = [
+        a for response in responses for a in response.get("assessments", [])
+    ]
+    combined["triggeredSegments"] = triggered
+    return combined
+
 
 class GuardrailsHandler:
     def __init__(self, config):
         logger.info("Initializing GuardrailsHandler")
-        self.guardrails_runtime = boto3.client("bedrock-runtime")
+        self.guardrails_runtime = get_client("bedrock-runtime", read_timeout=10)
         self.guardrail_id = config.GUARDRAIL_ID
         self.guardrail_version = config.GUARDRAIL_VERSION
+        self.segment_chars = config.GUARDRAIL_SEGMENT_CHARS
+        self.prefilter = (
+            InputPrefilter.from_file(config.PREFILTER_CONFIG)
+            if config.PREFILTER_CONFIG
+            else InputPrefilter()
+        )
+        self.caller = get_caller(
+            f"guardrail:{self.guardrails_runtime.meta.region_name}",
+            hedge_delay=config.HEDGE_DELAY,
+        )
         logger.debug(f"Guardrail ID: {self.guardrail_id}")
         logger.debug(f"Guardrail Version: {self.guardrail_version}")
 
@@ -19,7 +133,8 @@ class GuardrailsHandler:
         logger.info(f"Applying guardrail for {source}")
         guardrail_payload = [{"text": {"text": text}}]
         try:
-            response = self.guardrails_runtime.apply_guardrail(
+            response = self.caller.call_hedged(
+                self.guardrails_runtime.apply_guardrail,
                 guardrailIdentifier=self.guardrail_id,
                 guardrailVersion=self.guardrail_version,
                 source=source,
@@ -31,12 +146,27 @@ class GuardrailsHandler:
             logger.error(
                 f"An error occurred while applying guardrail for {source}: {str(e)}"
             )
-            return None
+            raise
 
     def check_input(self, text):
         logger.info("Checking query with guardrail")
+        rejection = self.prefilter.check(text)
+        if rejection is not None:
+            return rejection
         return self.apply_guardrail(text, "INPUT")
 
     def check_output(self, text):
         logger.info("Checking LLM response with guardrail")
-        return self.apply_guardrail(text, "OUTPUT")
+        if len(text) <= self.segment_chars:
+            return self.apply_guardrail(text, "OUTPUT")
+
+        segments = split_segments(text, self.segment_chars)
+        logger.info(f"Checking LLM response in {len(segments)} segments")
+        futures = [
+            _segment_pool.submit(
+                copy_context().run, self.apply_guardrail, segment, "OUTPUT"
+            )
+            for segment in segments
+        ]
+        responses = [future.result() for future in futures]
+        return combine_segment_responses(segments, responses)
@@ -0,0 +1,508 @@
+import argparse
+import hashlib
+import itertools
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from opensearchpy import helpers
+from pypdf import PdfReader
+
+from ..config import Config
+from .dedupe import LSHIndex, MinHasher, content_hash
+from .opensearch import IndexVersion, OpenSearchHandler
+
+logger = logging.getLogger(__name__)
+
+TEXT_SUFFIXES = {".txt", ".md"}
+PDF_SUFFIXES = {".pdf"}
+MAX_CHUNKS_PER_DOCUMENT = 10000
+
+
+@dataclass
+class Chunk:
+    text: str
+    """the chunk's text, as stored in the index"""
+    metadata: dict
+    """source path and page, stored alongside the text"""
+
+
+@dataclass
+class IngestionStats:
+    documents: int = 0
+    chunks: int = 0
+    failed_documents: int = 0
+    failed_chunks: int = 0
+    unchanged_documents: int = 0
+    deleted_documents: int = 0
+    unchanged_chunks: int = 0
+    duplicate_chunks: int = 0
+    deleted_chunks: int = 0
+    started: float = field(default_factory=time.monotonic)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def documents_per_second(self) -> float:
+        return self.documents / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.documents} documents ({self.documents_per_second:.2f}/s), "
+            f"{self.chunks} chunks ({self.chunks_per_second:.2f}/s), "
+            f"{self.failed_documents} failed documents, "
+            f"{self.failed_chunks} failed chunks, "
+            f"{self.unchanged_documents} unchanged documents, "
+            f"{self.deleted_documents} deleted documents, "
+            f"{self.unchanged_chunks} unchanged chunks, "
+            f"{self.duplicate_chunks} duplicate chunks, "
+            f"{self.deleted_chunks} deleted chunks in {self.elapsed:.1f}s"
+        )
+
+
+def iter_files(directory: str | Path):
+    """Yield every PDF and text file under `directory`, in a stable order."""
+    suffixes = TEXT_SUFFIXES | PDF_SUFFIXES
+    for path in sorted(Path(directory).rglob("*")):
+        if path.is_file() and path.suffix.lower() in suffixes:
+            yield path
+
+
+def iter_pages(path: Path):
+    """Yield `(page_number, text)` for a file, reading PDFs one page at a time."""
+    if path.suffix.lower() in PDF_SUFFIXES:
+        reader = PdfReader(path)
+        for page_number, page in enumerate(reader.pages, start=1):
+            yield page_number, page.extract_text() or ""
+    else:
+        yield 1, path.read_text(errors="replace")
+
+
+def file_hash(path: Path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+class IngestionPipeline:
+    """Streams documents from a directory into the vector index.
+
+    Files are read, split and embedded lazily, so memory use depends on
+    `batch_size` and `workers`, not on the size of the corpus. Batches are
+    embedded and bulk written on a bounded thread pool; when every worker is
+    busy the reader waits rather than queueing more work.
+    """
+
+    def __init__(
+        self,
+        opensearch: OpenSearchHandler,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 100,
+        batch_size: int = 32,
+        workers: int = 4,
+        max_retries: int = 3,
+    ):
+        logger.info("Initializing IngestionPipeline")
+        self.index_name = opensearch.index_name
+        self.client = opensearch.get_client()
+        self.embeddings = opensearch.get_embeddings()
+        self.index_version = IndexVersion(self.client, self.index_name)
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap
+        )
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_retries = max_retries
+        self.stats = IngestionStats()
+
+    def _publish_version(self):
+        # Lets retrieval caches know their entries are out of date.
+        stats = self.stats
+        if stats.chunks or stats.deleted_chunks or stats.deleted_documents:
+            self.index_version.bump()
+
+    def iter_document_chunks(self, path: Path, source: str):
+        for page_number, text in iter_pages(path):
+            for chunk_text in self.splitter.split_text(text):
+                yield Chunk(
+                    text=chunk_text,
+                    metadata={
+                        "source": source,
+                        "page": page_number,
+                        "content_hash": content_hash(chunk_text),
+                    },
+                )
+
+    def iter_chunks(self, directory: str | Path):
+        """Yield chunks from every file under `directory`, one page at a time."""
+        root = Path(directory)
+        for path in iter_files(root):
+            source = str(path.relative_to(root))
+            try:
+                yield from self.iter_document_chunks(path, source)
+            except Exception as e:
+                logger.error(f"Failed to read {source}, skipping: {str(e)}")
+                with self.stats.lock:
+                    self.stats.failed_documents += 1
+                continue
+            with self.stats.lock:
+                self.stats.documents += 1
+
+    def _actions(self, chunks: list[Chunk], vectors: list[list[float]]):
+        for chunk, vector in zip(chunks, vectors):
+            # Serverless collections don't accept _id, so like langchain's
+            # OpenSearchVectorSearch we store it as a plain field.
+            yield {
+                "_op_type": "index",
+                "_index": self.index_name,
+                "id": str(uuid.uuid4()),
+                "vector_field": vector,
+                "text": chunk.text,
+                "metadata": chunk.metadata,
+            }
+
+    def _write_batch(self, chunks: list[Chunk]) -> int:
+        """Embed and index a batch, returning the number of chunks that failed."""
+        try:
+            vectors = self.embeddings.embed_documents([c.text for c in chunks])
+            written, errors = helpers.bulk(
+                self.client,
+                self._actions(chunks, vectors),
+                max_retries=self.max_retries,
+                raise_on_error=False,
+            )
+        except Exception as e:
+            logger.error(f"Failed to ingest a batch of {len(chunks)} chunks: {str(e)}")
+            written, errors = 0, chunks
+        with self.stats.lock:
+            self.stats.chunks += written
+            self.stats.failed_chunks += len(errors)
+        return len(errors)
+
+    def run(self, directory: str | Path, log_every: float = 10) -> IngestionStats:
+        logger.info(f"Ingesting {directory} into {self.index_name}")
+        if not self.client.indices.exists(index=self.index_name):
+            logger.error(f"Index {self.index_name} does not exist")
+            raise ValueError(f"Index {self.index_name} does not exist")
+
+        self.stats = IngestionStats()
+        # At most one batch waiting per worker, beyond that the reader blocks.
+        slots = threading.BoundedSemaphore(self.workers * 2)
+        last_log = time.monotonic()
+
+        def release(_):
+            slots.release()
+
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="ingest"
+        ) as pool:
+            for batch in itertools.batched(
+                self.iter_chunks(directory), self.batch_size
+            ):
+                slots.acquire()
+                pool.submit(self._write_batch, list(batch)).add_done_callback(release)
+                if time.monotonic() - last_log > log_every:
+                    logger.info(f"Ingestion progress: {self.stats}")
+                    last_log = time.monotonic()
+
+        self._publish_version()
+        logger.info(f"Ingestion finished: {self.stats}")
+        return self.stats
+
+
+class IncrementalIngestionPipeline(IngestionPipeline):
+    """Brings the index in line with a directory, embedding only what changed.
+
+    Each chunk is stored with a hash of its text and of the current version
+    of the file it came from. Files whose chunks all carry the file's
+    current hash are skipped without being read; changed files are
+    re-chunked and only chunks with new hashes are embedded. Their stale
+    chunks are deleted, and the chunks they kept are tagged with the new
+    file hash, after the new ones are written, so a document is never
+    missing from the index mid-update. Documents no longer in the directory
+    are deleted.
+
+    Near-duplicate chunks, from any document, are detected with MinHash/LSH
+    and only the first copy is indexed. Only chunks of the current version
+    of a file still in the directory count as originals, so a renamed or
+    edited file isn't skipped in favour of chunks about to be deleted. A
+    skipped copy isn't restored if the original is later deleted, until its
+    own document changes.
+
+    Lookups use the `.keyword` sub-fields OpenSearch's dynamic mapping
+    creates for the metadata strings.
+    """
+
+    def __init__(self, opensearch: OpenSearchHandler, dedupe: bool = True, **kwargs):
+        super().__init__(opensearch, **kwargs)
+        self.dedupe = dedupe
+        self.hasher = MinHasher()
+
+    def _search(self, body: dict) -> dict:
+        return self.client.search(index=self.index_name, body=body)
+
+    def indexed_sources(self) -> set[str]:
+        response = self._search(
+            {
+                "size": 0,
+                "aggs": {
+                    "sources": {
+                        "terms": {"field": "metadata.source.keyword", "size": 65535}
+                    }
+                },
+            }
+        )
+        buckets = response["aggregations"]["sources"]["buckets"]
+        return {bucket["key"] for bucket in buckets}
+
+    def indexed_chunks(self, source: str) -> list[dict]:
+        response = self._search(
+            {
+                "size": MAX_CHUNKS_PER_DOCUMENT,
+                "_source": ["metadata.content_hash", "metadata.doc_hash"],
+                "query": {"term": {"metadata.source.keyword": source}},
+            }
+        )
+        return response["hits"]["hits"]
+
+    def _seed_duplicates(
+        self,
+        lsh: LSHIndex,
+        chunks: list[Chunk],
+        source: str,
+        stale_ids: set,
+        doc_hashes: dict[str, str],
+    ):
+        """Load indexed chunks that might duplicate `chunks` into the LSH index.
+
+        `doc_hashes` maps every file in the directory to its current hash.
+        Chunks of other files only count if they are from that version.
+        """
+        band_keys = sorted(
+            {key for chunk in chunks for key in chunk.metadata["minhash_bands"]}
+        )
+        if not band_keys:
+            return
+        response = self._search(
+            {
+                "size": MAX_CHUNKS_PER_DOCUMENT,
+                "_source": [
+                    "metadata.minhash",
+                    "metadata.source",
+                    "metadata.doc_hash",
+                ],
+                "query": {"terms": {"metadata.minhash_bands.keyword": band_keys}},
+            }
+        )
+        for hit in response["hits"]["hits"]:
+            metadata = hit["_source"].get("metadata", {})
+            if metadata.get("source") == source:
+                current = hit["_id"] not in stale_ids
+            else:
+                current = metadata.get("doc_hash") == doc_hashes.get(
+                    metadata.get("source")
+                )
+            if current and metadata.get("minhash"):
+                lsh.add(hit["_id"], metadata["minhash"])
+
+    def _delete(self, ids: list[str]):
+        if not ids:
+            return
+        deleted, errors = helpers.bulk(
+            self.client,
+            (
+                {"_op_type": "delete", "_index": self.index_name, "_id": _id}
+                for _id in ids
+            ),
+            max_retries=self.max_retries,
+            raise_on_error=False,
+        )
+        if errors:
+            logger.error(f"Failed to delete {len(errors)} stale chunks")
+        with self.stats.lock:
+            self.stats.deleted_chunks += deleted
+
+    def _retag(self, ids: list[str], doc_hash: str):
+        """Mark chunks kept from an earlier version of a file as current."""
+        if not ids:
+            return
+        _, errors = helpers.bulk(
+            self.client,
+            (
+                {
+                    "_op_type": "update",
+                    "_index": self.index_name,
+                    "_id": _id,
+                    "doc": {"metadata": {"doc_hash": doc_hash}},
+                }
+                for _id in ids
+            ),
+            max_retries=self.max_retries,
+            raise_on_error=False,
+        )
+        if errors:
+            # The document is re-chunked again on the next run.
+            logger.error(f"Failed to update the doc_hash of {len(errors)} chunks")
+
+    def _sync_document(
+        self, path: Path, source: str, lsh: LSHIndex, doc_hashes: dict[str, str]
+    ):
+        doc_hash = doc_hashes[source]
+        indexed = self.indexed_chunks(source)
+        indexed_doc_hashes = {
+            hit["_source"].get("metadata", {}).get("doc_hash") for hit in indexed
+        }
+        # Every chunk must be from this version. Matching any one of them
+        # would treat a file reverted to an earlier version as unchanged.
+        if indexed_doc_hashes == {doc_hash}:
+            with self.stats.lock:
+                self.stats.unchanged_documents += 1
+            return
+
+        indexed_hashes = {
+            hit["_source"].get("metadata", {}).get("content_hash") for hit in indexed
+        }
+        chunks = []
+        current_hashes = set()
+        for chunk in self.iter_document_chunks(path, source):
+            current_hashes.add(chunk.metadata["content_hash"])
+            if chunk.metadata["content_hash"] in indexed_hashes:
+                with self.stats.lock:
+                    self.stats.unchanged_chunks += 1
+                continue
+            chunk.metadata["doc_hash"] = doc_hash
+            chunks.append(chunk)
+        stale_ids = {
+            hit["_id"]
+            for hit in indexed
+            if hit["_source"].get("metadata", {}).get("content_hash")
+            not in current_hashes
+        }
+        kept_ids = [
+            hit["_id"]
+            for hit in indexed
+            if hit["_id"] not in stale_ids
+            and hit["_source"].get("metadata", {}).get("doc_hash") != doc_hash
+        ]
+
+        if self.dedupe:
+            for chunk in chunks:
+                signature = self.hasher.signature(chunk.text)
+                chunk.metadata["minhash"] = signature
+                chunk.metadata["minhash_bands"] = self.hasher.band_keys(signature)
+            self._seed_duplicates(lsh, chunks, source, stale_ids, doc_hashes)
+            unique = []
+            for chunk in chunks:
+                duplicate = lsh.add_if_unique(
+                    chunk.metadata["content_hash"], chunk.metadata["minhash"]
+                )
+                if duplicate is None:
+                    unique.append(chunk)
+                else:
+                    logger.debug(f"Chunk from {source} duplicates {duplicate}")
+            with self.stats.lock:
+                self.stats.duplicate_chunks += len(chunks) - len(unique)
+            chunks = unique
+
+        failures = 0
+        for batch in itertools.batched(chunks, self.batch_size):
+            failures += self._write_batch(list(batch))
+        if failures:
+            logger.error(
+                f"{failures} chunks of {source} failed to index, keeping its stale chunks"
+            )
+            return
+        self._delete(list(stale_ids))
+        self._retag(kept_ids, doc_hash)
+        with self.stats.lock:
+            self.stats.documents += 1
+
+    def _sync_document_safely(
+        self, path: Path, source: str, lsh: LSHIndex, doc_hashes: dict[str, str]
+    ):
+        try:
+            self._sync_document(path, source, lsh, doc_hashes)
+        except Exception as e:
+            logger.error(f"Failed to sync {source}, skipping: {str(e)}")
+            with self.stats.lock:
+                self.stats.failed_documents += 1
+
+    def run(self, directory: str | Path, log_every: float = 10) -> IngestionStats:
+        logger.info(f"Incrementally syncing {directory} into {self.index_name}")
+        if not self.client.indices.exists(index=self.index_name):
+            logger.error(f"Index {self.index_name} does not exist")
+            raise ValueError(f"Index {self.index_name} does not exist")
+
+        self.stats = IngestionStats()
+        root = Path(directory)
+        previous_sources = self.indexed_sources()
+        paths = {str(path.relative_to(root)): path for path in iter_files(root)}
+        lsh = LSHIndex(self.hasher)
+        slots = threading.BoundedSemaphore(self.workers * 2)
+        last_log = time.monotonic()
+
+        def release(_):
+            slots.release()
+
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="ingest"
+        ) as pool:
+            # Hashed up front so deduplication can tell which indexed chunks
+            # belong to the current version of each file.
+            doc_hashes = dict(zip(paths, pool.map(file_hash, paths.values())))
+            for source, path in paths.items():
+                slots.acquire()
+                pool.submit(
+                    self._sync_document_safely, path, source, lsh, doc_hashes
+                ).add_done_callback(release)
+                if time.monotonic() - last_log > log_every:
+                    logger.info(f"Sync progress: {self.stats}")
+                    last_log = time.monotonic()
+
+        for source in sorted(previous_sources - paths.keys()):
+            logger.info(f"Removing deleted document {source}")
+            self._delete([hit["_id"] for hit in self.indexed_chunks(source)])
+            with self.stats.lock:
+                self.stats.deleted_documents += 1
+
+        self._publish_version()
+        logger.info(f"Sync finished: {self.stats}")
+        return self.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Ingest PDFs and text files into the vector index."
+    )
+    parser.add_argument("directory")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="index every chunk without checking what is already indexed",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    opensearch = OpenSearchHandler(Config())
+    pipeline_class = IngestionPipeline if args.full else IncrementalIngestionPipeline
+    pipeline = pipeline_class(
+        opensearch, batch_size=args.batch_size, workers=args.workers
+    )
+    print(pipeline.run(args.directory))
+
+
+if __name__ == "__main__":
+    main()
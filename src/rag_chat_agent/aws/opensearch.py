@@ -1,14 +1,123 @@
 import logging
+import threading
+import time
+import uuid
+from functools import lru_cache
 
 import boto3
 from langchain_community.embeddings import BedrockEmbeddings
 from langchain_community.vectorstores import OpenSearchVectorSearch
-from opensearchpy import RequestsHttpConnection
+from langchain_core.embeddings import Embeddings
+from opensearchpy import NotFoundError, OpenSearch, RequestsHttpConnection
 from requests_aws4auth import AWS4Auth
 
+from .clients import get_client
+from .resilience import get_caller
+
 logger = logging.getLogger(__name__)
 
 
+class ResilientEmbeddings(Embeddings):
+    """Routes embedding calls through a ResilientCaller, hedging single queries."""
+
+    def __init__(self, embeddings: Embeddings, caller):
+        self.embeddings = embeddings
+        self.caller = caller
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.caller.call_hedged(self.embeddings.embed_query, text)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.caller.call(self.embeddings.embed_documents, texts)
+
+
+@lru_cache(maxsize=None)
+def _get_embeddings(region: str, model_id: str, hedge_delay: float):
+    # Shared by every handler using the same model in the same region.
+    embeddings = BedrockEmbeddings(
+        client=get_client("bedrock-runtime", region_name=region, read_timeout=10),
+        model_id=model_id,
+        region_name=region,
+    )
+    logger.debug("Created Bedrock embeddings")
+    caller = get_caller(f"embeddings:{region}:{model_id}", hedge_delay=hedge_delay)
+    return ResilientEmbeddings(embeddings, caller)
+
+
+class IndexVersion:
+    """Version marker for an index, changed whenever ingestion changes the index.
+
+    Markers are kept in a small `<index>-version` index, as serverless
+    collections don't support writing documents by id; the newest one is
+    current. Reads are cached for `check_interval` seconds, so callers can
+    check the version on every request. Only one caller at a time refreshes
+    it; the others carry on with the last known version meanwhile.
+    """
+
+    def __init__(self, client, index_name: str, check_interval: float = 60):
+        self.client = client
+        self.index_name = f"{index_name}-version"
+        self.check_interval = check_interval
+        self.version = None
+        self.checked_at = None
+        self.refreshing = False
+        self.lock = threading.Lock()
+
+    def get(self) -> str | None:
+        """The current version, or None if ingestion has never set one."""
+        with self.lock:
+            now = time.monotonic()
+            stale = (
+                self.checked_at is None or now - self.checked_at > self.check_interval
+            )
+            if not stale or self.refreshing:
+                return self.version
+            self.refreshing = True
+            version = self.version
+
+        # Read outside the lock, so a slow read doesn't hold up other callers.
+        try:
+            version = self._read()
+        except Exception as e:
+            # Keep the last known version, cached entries still expire.
+            logger.warning(f"Failed to read {self.index_name}: {str(e)}")
+        with self.lock:
+            self.version = version
+            self.checked_at = time.monotonic()
+            self.refreshing = False
+        return version
+
+    def _read(self) -> str | None:
+        try:
+            response = self.client.search(
+                index=self.index_name,
+                body={
+                    "size": 1,
+                    "sort": [{"updated": {"order": "desc"}}],
+                    "_source": ["version"],
+                },
+            )
+        except NotFoundError:
+            return None
+        hits = response["hits"]["hits"]
+        return hits[0]["_source"]["version"] if hits else None
+
+    def bump(self) -> str:
+        """Record a new version, invalidating anything cached under the old one."""
+        version = str(uuid.uuid4())
+        if not self.client.indices.exists(index=self.index_name):
+            logger.info(f"Creating version index {self.index_name}")
+            self.client.indices.create(index=self.index_name)
+        self.client.index(
+            index=self.index_name, body={"version": version, "updated": time.time()}
+        )
+        logger.info(f"Set {self.index_name} to {version}")
+        with self.lock:
+            self.version = version
+            self.checked_at = time.monotonic()
+        return version
+
+
 class OpenSearchHandler:
     def __init__(self, config):
         logger.info("Initializing OpenSearchHandler")
@@ -16,6 +125,7 @@ class OpenSearchHandler:
         self.index_name = config.INDEX_NAME
         self.embedding_model = config.EMBEDDING_MODEL
         self.region = config.DATA_REGION
+        self.hedge_delay = config.HEDGE_DELAY
         logger.debug(f"OpenSearch URL: {self.url}")
         logger.debug(f"Index Name: {self.index_name}")
         logger.debug(f"Embedding Model: {self.embedding_model}")
@@ -36,14 +146,31 @@ class OpenSearchHandler:
             logger.error(f"Error creating AWS authentication: {str(e)}")
             raise
 
+    def get_client(self, timeout: float = 60, max_retries: int = 3):
+        logger.info("Creating OpenSearch client")
+        return OpenSearch(
+            hosts=[self.url],
+            http_auth=self.awsauth,
+            use_ssl=True,
+            verify_certs=True,
+            connection_class=RequestsHttpConnection,
+            timeout=timeout,
+            max_retries=max_retries,
+        )
+
+    def get_index_version(self, check_interval: float = 60) -> IndexVersion:
+        # Checked on the request path, so fail fast rather than hold up the turn.
+        client = self.get_client(timeout=2, max_retries=0)
+        return IndexVersion(client, self.index_name, check_interval)
+
+    def get_embeddings(self):
+        return _get_embeddings(self.region, self.embedding_model, self.hedge_delay)
+
     def get_retriever(self, k=10):
         logger.info(f"Creating retriever with k={k}")
 
         try:
-            embeddings = BedrockEmbeddings(
-                model_id=self.embedding_model, region_name=self.region
-            )
-            logger.debug("Created Bedrock embeddings")
+            embeddings = self.get_embeddings()
             docsearch = OpenSearchVectorSearch(
                 opensearch_url=self.url,
                 index_name=self.index_name,
@@ -0,0 +1,105 @@
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+INTERVENED = "GUARDRAIL_INTERVENED"
+
+DEFAULT_BLOCKED_MESSAGE = "Sorry, I can't help with that request."
+
+DEFAULT_DENYLIST = {
+    "ignore_instructions": r"\b(ignore|disregard|forget)\s+(all\s+|any\s+)?(the\s+)?"
+    r"(previous|prior|above|earlier)\s+(instructions|prompts?|rules)",
+    "reveal_prompt": r"\b(reveal|show|print|repeat)\s+(me\s+)?(your|the)\s+"
+    r"(system\s+)?(prompt|instructions)",
+    "jailbreak_persona": r"\byou\s+are\s+now\s+(DAN|in\s+developer\s+mode)\b",
+}
+"""prompt injection phrasing rejected outright, by rule name"""
+
+DEFAULT_PII_PATTERNS = {
+    "uk_national_insurance": r"\b[A-CEGHJ-PR-TW-Z]{2}\s?\d{2}\s?\d{2}\s?\d{2}\s?[A-D]\b",
+    "payment_card": r"\b(?:\d[ -]?){15,18}\d\b",
+    "uk_sort_code_account": r"\b\d{2}-\d{2}-\d{2}\s+\d{8}\b",
+}
+"""PII that should never be sent to the model, by rule name, matched case sensitively"""
+
+# Control characters other than tab and newlines, plus zero width and bidi
+# override characters that are used to hide instructions.
+_DISALLOWED_CHARS = re.compile(
+    r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f\u200b-\u200f\u202a-\u202e\u2066-\u2069]"
+)
+
+
+def _compile_rules(rules: dict[str, str], flags: int = 0):
+    """Compile named patterns into one alternation, returning the pattern and
+    a map from group name back to rule name."""
+    if not rules:
+        return None, {}
+    names = {}
+    parts = []
+    for i, (name, pattern) in enumerate(rules.items()):
+        group = f"r{i}"
+        names[group] = name
+        parts.append(f"(?P<{group}>{pattern})")
+    return re.compile("|".join(parts), flags), names
+
+
+class InputPrefilter:
+    """Rejects clearly bad input locally, before the ApplyGuardrail round trip.
+
+    Rejections have the same shape as an ApplyGuardrail response that
+    intervened, so callers can't tell which stage refused the input.
+    Anything the pre-filter lets through still goes to the remote guardrail.
+    """
+
+    def __init__(
+        self,
+        max_length: int = 4000,
+        denylist: dict[str, str] | None = None,
+        pii_patterns: dict[str, str] | None = None,
+        blocked_message: str = DEFAULT_BLOCKED_MESSAGE,
+    ):
+        self.max_length = max_length
+        self.blocked_message = blocked_message
+        self.denylist, self.denylist_names = _compile_rules(
+            DEFAULT_DENYLIST if denylist is None else denylist, re.IGNORECASE
+        )
+        # Case sensitive, as e.g. the National Insurance format would otherwise
+        # match ordinary words around a number ("on 250000 a year").
+        self.pii, self.pii_names = _compile_rules(
+            DEFAULT_PII_PATTERNS if pii_patterns is None else pii_patterns
+        )
+
+    @classmethod
+    def from_file(cls, path: str):
+        """Build from a JSON file with any of the constructor's arguments."""
+        logger.info(f"Loading input pre-filter rules from {path}")
+        with open(path, "r") as file:
+            return cls(**json.load(file))
+
+    def _rejection(self, policy: str, rule: str) -> dict:
+        logger.info(f"Input pre-filter rejected query: {policy} {rule}")
+        return {
+            "action": INTERVENED,
+            "outputs": [{"text": self.blocked_message}],
+            "assessments": [{"localPrefilter": {"policy": policy, "rule": rule}}],
+        }
+
+    def check(self, text: str) -> dict | None:
+        """Return a guardrail style rejection for `text`, or None to pass it on."""
+        if not text or not text.strip():
+            return self._rejection("length", "blank")
+        if len(text) > self.max_length:
+            return self._rejection("length", "too_long")
+        if _DISALLOWED_CHARS.search(text):
+            return self._rejection("charset", "disallowed_characters")
+        if self.denylist is not None:
+            match = self.denylist.search(text)
+            if match:
+                return self._rejection("denylist", self.denylist_names[match.lastgroup])
+        if self.pii is not None:
+            match = self.pii.search(text)
+            if match:
+                return self._rejection("pii", self.pii_names[match.lastgroup])
+        return None
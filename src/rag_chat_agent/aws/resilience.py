@@ -0,0 +1,410 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+
+from botocore.config import Config as BotoConfig
+from botocore.exceptions import (
+    ClientError,
+    ConnectionClosedError,
+    ConnectTimeoutError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ServiceQuotaExceededException",
+    "InternalServerException",
+    "ModelNotReadyException",
+    "ModelTimeoutException",
+    "RequestLimitExceeded",
+    "ProvisionedThroughputExceededException",
+}
+"""ClientError codes that are worth retrying"""
+
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceQuotaExceededException",
+    "RequestLimitExceeded",
+    "ProvisionedThroughputExceededException",
+}
+"""ClientError codes that mean we are sending requests too quickly"""
+
+_turn_deadline: ContextVar[float | None] = ContextVar("turn_deadline", default=None)
+
+# Shared by every hedged call. Small, as hedges are only ever one extra request;
+# primary requests never queue here, see ResilientCaller._start.
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is refused because the endpoint's circuit is open."""
+
+
+class DeadlineExceededError(Exception):
+    """Raised when there is no time left in the turn to make another attempt."""
+
+
+@contextmanager
+def turn_deadline(seconds: float):
+    """Bound every resilient call made inside the block to `seconds` from now.
+
+    Nested blocks never extend an outer deadline.
+    """
+    deadline = time.monotonic() + seconds
+    outer = _turn_deadline.get()
+    if outer is not None:
+        deadline = min(deadline, outer)
+    token = _turn_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _turn_deadline.reset(token)
+
+
+def remaining_time() -> float | None:
+    """Seconds left before the current turn deadline, or None if unbounded."""
+    deadline = _turn_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def _wait_timeout(limit: float | None = None) -> float | None:
+    """`limit`, cut short by the turn deadline."""
+    remaining = remaining_time()
+    if remaining is None:
+        return limit
+    remaining = max(remaining, 0)
+    return remaining if limit is None else min(limit, remaining)
+
+
+def _exception_chain(exc: BaseException):
+    # langchain re-raises boto errors as ValueErrors, so look through the chain.
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        yield exc
+        exc = exc.__cause__ or exc.__context__
+
+
+def error_code(exc: Exception) -> str | None:
+    for e in _exception_chain(exc):
+        if isinstance(e, ClientError):
+            return e.response.get("Error", {}).get("Code")
+    return None
+
+
+def is_throttling(exc: Exception) -> bool:
+    return error_code(exc) in THROTTLING_ERROR_CODES
+
+
+def is_retryable(exc: Exception) -> bool:
+    for e in _exception_chain(exc):
+        if isinstance(
+            e,
+            (
+                ConnectionClosedError,
+                ConnectTimeoutError,
+                EndpointConnectionError,
+                ReadTimeoutError,
+            ),
+        ):
+            return True
+    return error_code(exc) in RETRYABLE_ERROR_CODES
+
+
+def get_boto_config(read_timeout: int = 60, max_attempts: int = 1) -> BotoConfig:
+    """Botocore config for clients whose calls are wrapped by a ResilientCaller.
+
+    botocore's own retries are turned off by default so attempts are not
+    multiplied by our retry loop.
+    """
+    return BotoConfig(
+        connect_timeout=5,
+        read_timeout=read_timeout,
+        retries={"mode": "standard", "total_max_attempts": max_attempts},
+    )
+
+
+def get_adaptive_boto_config(read_timeout: int = 120, max_attempts: int = 4):
+    """Botocore config for clients we hand to langchain and cannot wrap per call.
+
+    Uses botocore's adaptive mode, which adds client-side rate limiting to
+    the standard jittered retries.
+    """
+    return BotoConfig(
+        connect_timeout=5,
+        read_timeout=read_timeout,
+        retries={"mode": "adaptive", "total_max_attempts": max_attempts},
+    )
+
+
+class TokenBucket:
+    """Client-side rate limiter whose refill rate adapts to throttling.
+
+    The rate is halved whenever the service throttles us and creeps back up
+    towards `max_rate` on each success.
+    """
+
+    def __init__(self, max_rate: float, capacity: float, min_rate: float = 0.5):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.rate = max_rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, timeout: float | None = None) -> bool:
+        """Take a token, waiting up to `timeout` seconds. Returns False on timeout."""
+        give_up = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait_for = (1 - self.tokens) / self.rate
+            if give_up is not None and time.monotonic() + wait_for > give_up:
+                return False
+            time.sleep(wait_for)
+
+    def on_throttle(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+        logger.debug(f"Token bucket rate reduced to {self.rate:.2f}/s")
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class CircuitBreaker:
+    """Per-endpoint circuit breaker.
+
+    Opens after `failure_threshold` consecutive failures and lets a single
+    probe request through once `reset_timeout` seconds have passed.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at >= self.reset_timeout:
+                    self.state = self.HALF_OPEN
+                    return True
+                return False
+            # Half open, a probe is already in flight.
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.state = self.CLOSED
+
+    def release_probe(self):
+        """Give up a probe let through by `allow_request` without an outcome.
+
+        Puts a half open breaker back to open, keeping `opened_at`, so the
+        next request may probe straight away.
+        """
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class ResilientCaller:
+    """Wraps calls to one AWS endpoint with rate limiting, retries and a circuit breaker.
+
+    Retries use full jitter exponential backoff and never sleep past the
+    current turn deadline (see `turn_deadline`).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_rate: float = 20,
+        burst: float = 10,
+        max_attempts: int = 4,
+        base_delay: float = 0.2,
+        max_delay: float = 5,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+        hedge_delay: float | None = None,
+    ):
+        self.name = name
+        self.bucket = TokenBucket(max_rate=max_rate, capacity=burst)
+        self.breaker = CircuitBreaker(
+            failure_threshold=failure_threshold, reset_timeout=reset_timeout
+        )
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_delay = hedge_delay
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def _attempt(self, fn, *args, **kwargs):
+        # Wait for the rate limit before asking the breaker, as a half open
+        # breaker must see the outcome of the probe it lets through.
+        if not self.bucket.acquire(timeout=remaining_time()):
+            raise DeadlineExceededError(
+                f"Turn deadline reached waiting for rate limit on {self.name}"
+            )
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"Circuit for {self.name} is open")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if is_throttling(e):
+                self.bucket.on_throttle()
+            if is_retryable(e):
+                self.breaker.record_failure()
+            else:
+                # The endpoint answered, the request itself was bad.
+                self.breaker.record_success()
+            raise
+        except BaseException:
+            # Interrupted without an outcome, e.g. KeyboardInterrupt.
+            self.breaker.release_probe()
+            raise
+        self.bucket.on_success()
+        self.breaker.record_success()
+        return result
+
+    def _submit(self, fn, *args, **kwargs):
+        # Run in a copy of our context so the turn deadline follows the call.
+        return _hedge_pool.submit(
+            copy_context().run, self._attempt, fn, *args, **kwargs
+        )
+
+    def _start(self, fn, *args, **kwargs) -> Future:
+        # The primary gets a thread of its own rather than queueing in the
+        # hedge pool, where time spent waiting would count toward hedge_delay.
+        future = Future()
+        context = copy_context()
+
+        def run():
+            try:
+                future.set_result(context.run(self._attempt, fn, *args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name=f"primary-{self.name}", daemon=True).start()
+        return future
+
+    def _hedged_attempt(self, fn, *args, **kwargs):
+        primary = self._start(fn, *args, **kwargs)
+        done, _ = wait([primary], timeout=_wait_timeout(self.hedge_delay))
+        if done:
+            return primary.result()
+
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceededError(
+                f"Turn deadline reached waiting for {self.name}"
+            )
+        logger.debug(f"Sending hedged request to {self.name}")
+        hedge = self._submit(fn, *args, **kwargs)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(
+                pending, timeout=_wait_timeout(), return_when=FIRST_COMPLETED
+            )
+            if not done:
+                raise DeadlineExceededError(
+                    f"Turn deadline reached waiting for {self.name}"
+                )
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def call(self, fn, *args, **kwargs):
+        """Call `fn(*args, **kwargs)`, retrying transient failures."""
+        return self._call(self._attempt, fn, *args, **kwargs)
+
+    def call_hedged(self, fn, *args, **kwargs):
+        """Like `call`, but fires a duplicate request if the first is slower
+        than `hedge_delay`. Only use for idempotent calls."""
+        if not self.hedge_delay:
+            return self.call(fn, *args, **kwargs)
+        return self._call(self._hedged_attempt, fn, *args, **kwargs)
+
+    def _call(self, attempt_fn, fn, *args, **kwargs):
+        for attempt in range(self.max_attempts):
+            try:
+                return attempt_fn(fn, *args, **kwargs)
+            except (CircuitOpenError, DeadlineExceededError):
+                logger.error(f"Not calling {self.name}, giving up")
+                raise
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_attempts - 1:
+                    raise
+                delay = self._backoff(attempt)
+                remaining = remaining_time()
+                if remaining is not None and delay >= remaining:
+                    logger.warning(
+                        f"No time left in turn to retry {self.name} after: {str(e)}"
+                    )
+                    raise
+                logger.warning(
+                    f"Retrying {self.name} in {delay:.2f}s "
+                    f"(attempt {attempt + 1}/{self.max_attempts}): {str(e)}"
+                )
+                time.sleep(delay)
+
+
+_callers: dict[str, ResilientCaller] = {}
+_callers_lock = threading.Lock()
+
+
+def get_caller(name: str, **kwargs) -> ResilientCaller:
+    """Return the process-wide ResilientCaller for the endpoint `name`.
+
+    Callers are shared so that rate limits and circuit state are per
+    endpoint rather than per handler instance. `kwargs` are only used the
+    first time a caller is created.
+    """
+    with _callers_lock:
+        if name not in _callers:
+            _callers[name] = ResilientCaller(name, **kwargs)
+        return _callers[name]
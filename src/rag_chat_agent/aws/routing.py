@@ -0,0 +1,200 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+
+from .resilience import CircuitBreaker, CircuitOpenError, is_retryable, is_throttling
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LLMEndpoint:
+    region: str
+    """the region the model is called in"""
+    model_id: str
+    """the bedrock model id or inference profile"""
+
+    @property
+    def name(self) -> str:
+        return f"{self.region}/{self.model_id}"
+
+
+def parse_endpoints(spec: str) -> list[LLMEndpoint]:
+    """Parse a comma separated list of `region=model_id` pairs."""
+    endpoints = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        region, sep, model_id = entry.partition("=")
+        if not sep or not region.strip() or not model_id.strip():
+            logger.error(f"Invalid LLM endpoint '{entry}'")
+            raise ValueError(
+                f"Invalid LLM endpoint '{entry}', expected 'region=model_id'"
+            )
+        endpoints.append(LLMEndpoint(region.strip(), model_id.strip()))
+    return endpoints
+
+
+@dataclass
+class EndpointHealth:
+    """Rolling view of how one endpoint has been behaving."""
+
+    endpoint: LLMEndpoint
+    priority: int
+    """position in the configured pool, lower is preferred"""
+    alpha: float = 0.2
+    """weight given to the newest observation in the moving averages"""
+    latency: float | None = None
+    """exponentially weighted mean latency of successful calls, in seconds"""
+    error_rate: float = 0.0
+    """exponentially weighted rate of retryable failures"""
+    error_half_life: float = 60.0
+    """seconds for the error rate to halve while the endpoint is not being used"""
+    last_failure: float = 0.0
+    calls: int = 0
+    failures: int = 0
+    throttles: int = 0
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record_success(self, elapsed: float):
+        with self.lock:
+            self.calls += 1
+            self.latency = (
+                elapsed
+                if self.latency is None
+                else self.alpha * elapsed + (1 - self.alpha) * self.latency
+            )
+            self.error_rate = (1 - self.alpha) * self.current_error_rate()
+        self.breaker.record_success()
+
+    def record_failure(self, exc: Exception):
+        with self.lock:
+            self.calls += 1
+            self.failures += 1
+            if is_throttling(exc):
+                self.throttles += 1
+            self.error_rate = self.alpha + (1 - self.alpha) * self.current_error_rate()
+            self.last_failure = time.monotonic()
+        self.breaker.record_failure()
+
+    def current_error_rate(self) -> float:
+        # Decay so an endpoint that failed a while ago is tried again.
+        if not self.error_rate:
+            return 0.0
+        age = time.monotonic() - self.last_failure
+        return self.error_rate * 0.5 ** (age / self.error_half_life)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "region": self.endpoint.region,
+                "model_id": self.endpoint.model_id,
+                "priority": self.priority,
+                "state": self.breaker.state,
+                "latency": self.latency,
+                "error_rate": self.current_error_rate(),
+                "calls": self.calls,
+                "failures": self.failures,
+                "throttles": self.throttles,
+            }
+
+
+class LLMRouter:
+    """Orders a pool of LLM endpoints by observed latency and error rate.
+
+    Endpoints keep their configured order until there is evidence against
+    them; each position down the pool costs `priority_penalty` in score so
+    a fallback region is only preferred once it is clearly healthier.
+    """
+
+    def __init__(self, endpoints: list[LLMEndpoint], priority_penalty: float = 0.25):
+        if not endpoints:
+            raise ValueError("LLMRouter needs at least one endpoint")
+        self.health = [
+            EndpointHealth(endpoint=endpoint, priority=i)
+            for i, endpoint in enumerate(endpoints)
+        ]
+        self.priority_penalty = priority_penalty
+
+    def _score(self, health: EndpointHealth, default_latency: float) -> float:
+        latency = health.latency if health.latency is not None else default_latency
+        return (
+            latency
+            * (1 + 4 * health.current_error_rate())
+            * (1 + self.priority_penalty * health.priority)
+        )
+
+    def ranked(self) -> list[EndpointHealth]:
+        """Endpoints in the order they should be tried for the next call."""
+        observed = [h.latency for h in self.health if h.latency is not None]
+        default_latency = sum(observed) / len(observed) if observed else 1.0
+        return sorted(
+            self.health,
+            key=lambda h: (
+                h.breaker.state != CircuitBreaker.CLOSED,
+                self._score(h, default_latency),
+            ),
+        )
+
+    def call(self, fn):
+        """Call `fn(index)` on each endpoint in ranked order until one succeeds.
+
+        `index` is the endpoint's position in the configured pool. Only
+        throttling and other retryable errors fail over; anything else is
+        raised straight away as another region would fail the same way.
+        """
+        last_error = None
+        for health in self.ranked():
+            if not health.breaker.allow_request():
+                continue
+            start = time.monotonic()
+            try:
+                result = fn(health.priority)
+            except Exception as e:
+                if not is_retryable(e):
+                    # The endpoint answered, the request itself was bad.
+                    health.breaker.record_success()
+                    raise
+                health.record_failure(e)
+                last_error = e
+                logger.warning(
+                    f"LLM endpoint {health.endpoint.name} failed, failing over: {str(e)}"
+                )
+                continue
+            except BaseException:
+                # Interrupted without an outcome, let the next request probe.
+                health.breaker.release_probe()
+                raise
+            health.record_success(time.monotonic() - start)
+            return result
+
+        logger.error("No LLM endpoint was able to handle the request")
+        if last_error is not None:
+            raise last_error
+        raise CircuitOpenError("All LLM endpoints have open circuits")
+
+    def stats(self) -> list[dict]:
+        return [health.stats() for health in self.health]
+
+
+_routers: dict[tuple[str, ...], LLMRouter] = {}
+_routers_lock = threading.Lock()
+
+
+def get_router(endpoints: list[LLMEndpoint]) -> LLMRouter:
+    """Return the process-wide router for this pool so health survives across agents."""
+    key = tuple(endpoint.name for endpoint in endpoints)
+    with _routers_lock:
+        if key not in _routers:
+            _routers[key] = LLMRouter(endpoints)
+        return _routers[key]
+
+
+def all_router_stats() -> dict[str, list[dict]]:
+    """Endpoint health of every LLM pool in use in this process."""
+    with _routers_lock:
+        routers = dict(_routers)
+    return {",".join(key): router.stats() for key, router in routers.items()}
@@ -19,6 +19,8 @@ class Config:
     """the name of the model used to embed queries to the collection"""
     LLM_MODEL: str = os.getenv("LLM_MODEL")
     """the name of the LLM used in the agent"""
+    LLM_ENDPOINTS: str = os.getenv("LLM_ENDPOINTS") or ""
+    """comma separated `region=model_id` pool to route LLM calls over, defaults to LLM_REGION and LLM_MODEL"""
     SESSION_HISTORY: str = os.getenv("SESSION_HISTORY")
     """session history table name"""
     RATING_HISTORY: str = os.getenv("RATING_HISTORY")
@@ -27,7 +29,23 @@ class Config:
     """id of the guardrails to run queries through"""
     GUARDRAIL_VERSION: str = os.getenv("GUARDRAILS_VERSION")
     """version number of the guardrails"""
+    PREFILTER_CONFIG: str = os.getenv("PREFILTER_CONFIG") or ""
+    """optional JSON file of rules for the local input pre-filter, see InputPrefilter"""
+    GUARDRAIL_SEGMENT_CHARS: int = int(os.getenv("GUARDRAIL_SEGMENT_CHARS") or 2000)
+    """answers longer than this are checked by the output guardrail in concurrent segments"""
     CHAT_HISTORY_LENGTH: int = os.getenv("CHAT_HISTORY_LENGTH") or 5
+    AGENT_MODE: str = os.getenv("AGENT_MODE") or "structured_chat"
+    """`structured_chat` parses JSON blob actions from the reply, `tool_calling` uses Bedrock's native tool use"""
+    PYTHON_REPL_WORKERS: int = int(os.getenv("PYTHON_REPL_WORKERS") or 0)
+    """sandbox worker processes for the python tool, 0 leaves the tool disabled"""
+    RETRIEVAL_CACHE_TTL: float = float(os.getenv("RETRIEVAL_CACHE_TTL") or 3600)
+    """seconds retriever results are shared between sessions, 0 disables the shared cache"""
+    RETRIEVAL_CACHE_SIZE: int = int(os.getenv("RETRIEVAL_CACHE_SIZE") or 1024)
+    """most retriever results kept in the shared cache"""
+    TURN_TIMEOUT: float = float(os.getenv("TURN_TIMEOUT") or 60)
+    """seconds an agent turn may spend retrying AWS calls before giving up"""
+    HEDGE_DELAY: float = float(os.getenv("HEDGE_DELAY") or 0)
+    """seconds before a duplicate guardrail or embedding request is sent, 0 disables hedging"""
 
     def __post_init__(self):
         # Check is any of the values are None.
@@ -45,5 +63,10 @@ class Config:
                 f"Field{'s' if len(missing_fields) > 1 else ''} '{missing_fields}' cannot be None"
             )
 
+        if self.AGENT_MODE not in ("structured_chat", "tool_calling"):
+            raise ValueError(
+                f"AGENT_MODE must be 'structured_chat' or 'tool_calling', not '{self.AGENT_MODE}'"
+            )
+
         logger.info("Loaded config for agent successfully.")
         # TODO more checks to see if URL is an URL and if regions are real regions etc.
@@ -0,0 +1,59 @@
+import logging
+import threading
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+PARSE_ERROR_TOOL = "_Exception"
+"""name langchain gives the step that feeds an unparseable model reply back"""
+
+
+class TurnMetrics(BaseCallbackHandler):
+    """Counts the LLM calls, tool calls and tokens used by one agent turn."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.llm_calls = 0
+        self.tool_calls = 0
+        self.parse_errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def on_llm_end(self, response, **kwargs):
+        prompt_tokens, completion_tokens = self._usage(response)
+        with self.lock:
+            self.llm_calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        with self.lock:
+            if (serialized or {}).get("name") == PARSE_ERROR_TOOL:
+                self.parse_errors += 1
+            else:
+                self.tool_calls += 1
+
+    @staticmethod
+    def _usage(response) -> tuple[int, int]:
+        # Converse models report usage on the message, InvokeModel ones in
+        # llm_output.
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(
+                    getattr(generation, "message", None), "usage_metadata", None
+                )
+                if usage:
+                    return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        usage = (response.llm_output or {}).get("usage") or {}
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {
+                "llm_calls": self.llm_calls,
+                "tool_calls": self.tool_calls,
+                "parse_errors": self.parse_errors,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+            }
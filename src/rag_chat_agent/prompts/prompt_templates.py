@@ -11,7 +11,15 @@ from langchain.prompts import (
 logger = logging.getLogger(__name__)
 
 
-def get_agent_prompt(custom_prompt_path: str | None = None):
+TOOL_CALLING_SYSTEM_TEMPLATE = """Respond to the human as helpfully and accurately as possible. Use the tools you have access to when they help, and respond directly when they don't."""
+
+
+def get_agent_prompt(custom_prompt_path: str | None = None, tool_calling: bool = False):
+    """Prompt for the agent.
+
+    With `tool_calling` the tools are passed to the model natively, so the
+    prompt leaves out the tool list and the JSON blob format instructions.
+    """
     logger.info("Configuring agent prompt template")
     system_template = """Respond to the human as helpfully and accurately as possible. You have access to the following tools:
 
@@ -51,6 +59,8 @@ def get_agent_prompt(custom_prompt_path: str | None = None):
     Begin! Reminder to ALWAYS respond with a valid json blob of a single action. Use tools if necessary. Respond directly if appropriate.
     Format is Action:```$JSON_BLOB```then Observation
     """
+    if tool_calling:
+        system_template = TOOL_CALLING_SYSTEM_TEMPLATE
     if custom_prompt_path:
         logger.info(f"Attempting to read custom prompt from {custom_prompt_path}")
         try:
@@ -76,6 +86,20 @@ def get_agent_prompt(custom_prompt_path: str | None = None):
     system_message_prompt = SystemMessagePromptTemplate.from_template(system_template)
     logger.debug("System message prompt created")
 
+    if tool_calling:
+        prompt_agent = ChatPromptTemplate.from_messages(
+            [
+                system_message_prompt,
+                MessagesPlaceholder(variable_name="chat_history", optional=True),
+                HumanMessagePromptTemplate.from_template("{input}"),
+                MessagesPlaceholder(variable_name="agent_scratchpad"),
+            ]
+        )
+        logger.debug("Tool calling chat prompt template created")
+        prompt_agent.partial_variables = {"chat_history": []}
+        logger.info("Agent prompt template configured successfully")
+        return prompt_agent
+
     human_template = (
         "{input}{agent_scratchpad}\n(reminder to respond in a JSON blob no matter what)"
     )
@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import fields
+
+from .agent import RAGChatAgent
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+CONFIG_FIELDS = {f.name for f in fields(Config)}
+
+
+class UnknownTenantError(KeyError):
+    pass
+
+
+class AgentRegistry:
+    """Serves several tenants, each with its own collection, index and prompt,
+    from one process.
+
+    Tenants are described by a mapping of tenant id to overrides of `Config`
+    fields, plus an optional `custom_prompt_path`, e.g.
+
+        {"hr": {"INDEX_NAME": "hr-policies", "custom_prompt_path": "hr.txt"}}
+
+    Fields a tenant doesn't set come from the environment as usual. One warm
+    RAGChatAgent is kept per tenant and serves all of its sessions; boto3,
+    embedding and LLM clients are shared between tenants wherever region
+    and model match. At most `max_warm` agents are kept, the least recently
+    used being evicted.
+    """
+
+    def __init__(
+        self,
+        tenants: dict[str, dict],
+        max_warm: int = 8,
+        model_kwargs: None | dict = None,
+    ):
+        logger.info(f"Initializing AgentRegistry with tenants {sorted(tenants)}")
+        self.tenants = {
+            tenant_id: self._tenant_config(tenant_id, overrides)
+            for tenant_id, overrides in tenants.items()
+        }
+        self.max_warm = max_warm
+        self.model_kwargs = model_kwargs
+        self.agents: OrderedDict[str, RAGChatAgent] = OrderedDict()
+        self.lock = threading.Lock()
+        self.build_locks = defaultdict(threading.Lock)
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs):
+        logger.info(f"Loading tenant configurations from {path}")
+        with open(path, "r") as file:
+            return cls(json.load(file), **kwargs)
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """Load tenants from the JSON file named by the TENANTS_CONFIG variable."""
+        path = os.getenv("TENANTS_CONFIG")
+        if not path:
+            logger.error("TENANTS_CONFIG is not set")
+            raise ValueError("TENANTS_CONFIG must be set to a tenants JSON file")
+        return cls.from_file(path, **kwargs)
+
+    @staticmethod
+    def _tenant_config(tenant_id: str, overrides: dict) -> tuple[Config, str | None]:
+        overrides = dict(overrides)
+        custom_prompt_path = overrides.pop("custom_prompt_path", None)
+        unknown = set(overrides) - CONFIG_FIELDS
+        if unknown:
+            logger.error(f"Tenant '{tenant_id}' has unknown fields {sorted(unknown)}")
+            raise ValueError(
+                f"Tenant '{tenant_id}' has unknown fields {sorted(unknown)}"
+            )
+        # Validate now so a bad tenant fails at start up, not on first request.
+        return Config(**overrides), custom_prompt_path
+
+    def get_agent(self, tenant_id: str) -> RAGChatAgent:
+        if tenant_id not in self.tenants:
+            logger.error(f"Unknown tenant '{tenant_id}'")
+            raise UnknownTenantError(tenant_id)
+
+        with self.lock:
+            agent = self.agents.get(tenant_id)
+            if agent is not None:
+                self.agents.move_to_end(tenant_id)
+                return agent
+
+        # Build outside the registry lock so other tenants aren't held up.
+        with self.build_locks[tenant_id]:
+            with self.lock:
+                agent = self.agents.get(tenant_id)
+            if agent is None:
+                start = time.time()
+                config, custom_prompt_path = self.tenants[tenant_id]
+                agent = RAGChatAgent(
+                    custom_prompt_path=custom_prompt_path,
+                    model_kwargs=self.model_kwargs,
+                    config=config,
+                )
+                logger.info(
+                    f"[TIMING] Building agent for tenant '{tenant_id}' took "
+                    f"{time.time() - start:.2f}s"
+                )
+
+        with self.lock:
+            self.agents[tenant_id] = agent
+            self.agents.move_to_end(tenant_id)
+            while len(self.agents) > self.max_warm:
+                evicted, _ = self.agents.popitem(last=False)
+                logger.info(f"Evicted idle tenant '{evicted}'")
+        return agent
+
+    def invoke(self, tenant_id: str, query, tokenID: str):
+        """Run one turn of `tokenID`'s conversation with the tenant's agent."""
+        logger.info(f"Routing session {tokenID} to tenant '{tenant_id}'")
+        return self.get_agent(tenant_id).invoke_agent(query, tokenID=tokenID)
@@ -0,0 +1,378 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from functools import partial
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from .aws.batch_writer import flush_batch_writers
+from .aws.routing import all_router_stats
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 64 * 1024
+DEFAULT_TENANT = "default"
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: list | None = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or []
+
+
+class _StreamEvents(BaseCallbackHandler):
+    """Forwards agent progress from the worker thread to the event loop."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, events: asyncio.Queue):
+        self.loop = loop
+        self.events = events
+
+    def _put(self, event: dict):
+        self.loop.call_soon_threadsafe(self.events.put_nowait, event)
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        self._put({"type": "tool", "name": (serialized or {}).get("name")})
+
+
+class ChatServer:
+    """ASGI app serving RAGChatAgent over HTTP.
+
+    Endpoints:
+        POST /chat         {"session_id", "input", "tenant"?} -> {"output"}
+        POST /chat/stream  same body, answers with server-sent events
+        POST /rating       {"session_id", "rating", "tenant"?} -> {"output"}
+        GET  /health       queue depth and LLM endpoint health
+
+    Turns run on a pool of `workers` threads. Up to `max_queue` more requests
+    may wait for a worker; beyond that requests are refused with a 503 so a
+    burst can't build an unbounded backlog. Turns of one session always run
+    one at a time and in order, and a session may have at most
+    `max_per_session` requests admitted, beyond that they get a 429, so one
+    session can't take every place in the queue. On shutdown new requests are refused and
+    running ones are given `drain_timeout` seconds to finish.
+
+    `get_agent` maps a tenant id to an agent. Anything with RAGChatAgent's
+    `invoke_agent` and `rate_conversation` works, so the server can be run
+    locally against stand-in backends.
+    """
+
+    def __init__(
+        self,
+        get_agent,
+        workers: int = 8,
+        max_queue: int = 32,
+        max_per_session: int = 4,
+        drain_timeout: float = 30,
+    ):
+        logger.info(f"Initializing ChatServer with {workers} workers")
+        self.get_agent = get_agent
+        self.workers = workers
+        self.max_admitted = workers + max_queue
+        self.max_per_session = max_per_session
+        self.drain_timeout = drain_timeout
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="agent"
+        )
+        self.admitted = 0
+        self.draining = False
+        self.idle = None
+        self.session_locks: dict[str, list] = {}
+
+    # ASGI plumbing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.drain()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        route = (scope["method"], scope["path"].rstrip("/"))
+        try:
+            if route == ("GET", "/health"):
+                await self._send_json(send, 200, self.health())
+            elif route == ("POST", "/chat"):
+                body = await self._read_json(receive)
+                await self._send_json(send, 200, await self.chat(body))
+            elif route == ("POST", "/chat/stream"):
+                body = await self._read_json(receive)
+                await self.chat_stream(body, send)
+            elif route == ("POST", "/rating"):
+                body = await self._read_json(receive)
+                await self._send_json(send, 200, await self.rate(body))
+            else:
+                raise HTTPError(404, "Not found")
+        except HTTPError as e:
+            await self._send_json(send, e.status, {"error": e.message}, e.headers)
+        except Exception as e:
+            logger.exception(f"Unhandled error serving {route}: {str(e)}")
+            await self._send_json(send, 500, {"error": "Internal server error"})
+
+    @staticmethod
+    async def _read_json(receive) -> dict:
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if len(body) > MAX_BODY_BYTES:
+                raise HTTPError(413, "Request body too large")
+            if not message.get("more_body"):
+                break
+        try:
+            data = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            raise HTTPError(400, "Request body must be JSON")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "Request body must be a JSON object")
+        return data
+
+    @staticmethod
+    async def _send_json(send, status: int, data: dict, headers: list | None = None):
+        body = json.dumps(data).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    *(headers or []),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    # Admission control
+
+    def _admit(self, session_id: str):
+        if self.draining:
+            raise HTTPError(503, "Server is shutting down")
+        if self.admitted >= self.max_admitted:
+            logger.warning("Request queue is full, shedding load")
+            raise HTTPError(503, "Server is busy", [(b"retry-after", b"1")])
+        entry = self.session_locks.get(session_id)
+        if entry is not None and entry[1] >= self.max_per_session:
+            logger.warning(f"Too many requests queued for session {session_id}")
+            raise HTTPError(
+                429, "Too many requests for this session", [(b"retry-after", b"1")]
+            )
+        self.session_locks.setdefault(session_id, [asyncio.Lock(), 0])[1] += 1
+        self.admitted += 1
+        if self.idle is None:
+            self.idle = asyncio.Event()
+        self.idle.clear()
+
+    def _release(self, session_id: str):
+        entry = self.session_locks[session_id]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self.session_locks[session_id]
+        self.admitted -= 1
+        if self.admitted == 0:
+            self.idle.set()
+
+    async def _in_session(self, session_id: str, fn, *args, **kwargs):
+        """Run `fn` on the worker pool once the session's earlier turns are done.
+
+        Takes over the request's admission (see `_admit`) and releases it once
+        the turn has finished, even if the request is cancelled first.
+        """
+        lock = self.session_locks[session_id][0]
+        try:
+            await lock.acquire()
+        except BaseException:
+            self._release(session_id)
+            raise
+        try:
+            call = partial(copy_context().run, fn, *args, **kwargs)
+            future = asyncio.get_running_loop().run_in_executor(self.executor, call)
+        except BaseException:
+            lock.release()
+            self._release(session_id)
+            raise
+
+        def finished(_):
+            lock.release()
+            self._release(session_id)
+
+        future.add_done_callback(finished)
+        # Shielded so a cancelled request keeps the session locked, and its
+        # place in the queue, until the worker is done with the turn.
+        return await asyncio.shield(future)
+
+    @staticmethod
+    def _field(body: dict, name: str) -> str:
+        value = body.get(name)
+        if not isinstance(value, str) or not value:
+            raise HTTPError(400, f"'{name}' must be a non-empty string")
+        return value
+
+    def _call_agent(self, tenant: str, method: str, *args, **kwargs):
+        # Runs on a worker, as building a tenant's agent can take seconds.
+        try:
+            agent = self.get_agent(tenant)
+        except KeyError:
+            raise HTTPError(404, f"Unknown tenant '{tenant}'")
+        return getattr(agent, method)(*args, **kwargs)
+
+    # Endpoints
+
+    async def chat(self, body: dict) -> dict:
+        session_id = self._field(body, "session_id")
+        query = self._field(body, "input")
+        tenant = body.get("tenant") or DEFAULT_TENANT
+        self._admit(session_id)
+        start = time.time()
+        output = await self._in_session(
+            session_id,
+            self._call_agent,
+            tenant,
+            "invoke_agent",
+            query,
+            tokenID=session_id,
+        )
+        logger.info(f"[TIMING] /chat took {time.time() - start:.2f}s")
+        return {"output": output}
+
+    async def chat_stream(self, body: dict, send):
+        session_id = self._field(body, "session_id")
+        query = self._field(body, "input")
+        tenant = body.get("tenant") or DEFAULT_TENANT
+        self._admit(session_id)
+        events = asyncio.Queue()
+        callbacks = [_StreamEvents(asyncio.get_running_loop(), events)]
+        # A task of its own, so the turn carries on if the client goes away.
+        turn = asyncio.ensure_future(
+            self._in_session(
+                session_id,
+                self._call_agent,
+                tenant,
+                "invoke_agent",
+                query,
+                tokenID=session_id,
+                callbacks=callbacks,
+            )
+        )
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                ],
+            }
+        )
+
+        async def emit(event: dict, more: bool = True):
+            data = f"data: {json.dumps(event)}\n\n".encode()
+            await send({"type": "http.response.body", "body": data, "more_body": more})
+
+        while not turn.done():
+            getter = asyncio.ensure_future(events.get())
+            done, _ = await asyncio.wait(
+                {getter, turn}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if getter in done:
+                await emit(getter.result())
+            else:
+                getter.cancel()
+        while not events.empty():
+            await emit(events.get_nowait())
+
+        try:
+            await emit({"type": "answer", "output": turn.result()}, more=False)
+        except HTTPError as e:
+            await emit({"type": "error", "error": e.message}, more=False)
+        except Exception as e:
+            logger.exception(f"Streaming turn failed: {str(e)}")
+            await emit({"type": "error", "error": "Internal server error"}, False)
+
+    async def rate(self, body: dict) -> dict:
+        session_id = self._field(body, "session_id")
+        rating = self._field(body, "rating")
+        tenant = body.get("tenant") or DEFAULT_TENANT
+        self._admit(session_id)
+        output = await self._in_session(
+            session_id,
+            self._call_agent,
+            tenant,
+            "rate_conversation",
+            rating,
+            tokenID=session_id,
+        )
+        return {"output": output}
+
+    def health(self) -> dict:
+        return {
+            "status": "draining" if self.draining else "ok",
+            "admitted": self.admitted,
+            "capacity": self.max_admitted,
+            "sessions": len(self.session_locks),
+            "llm_endpoints": all_router_stats(),
+        }
+
+    async def drain(self):
+        """Refuse new requests, wait for admitted ones, then flush queued writes."""
+        logger.info(f"Draining ChatServer, {self.admitted} requests in flight")
+        self.draining = True
+        if self.admitted and self.idle is not None:
+            try:
+                await asyncio.wait_for(self.idle.wait(), self.drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"Drain timed out with {self.admitted} requests in flight"
+                )
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        await asyncio.get_running_loop().run_in_executor(None, flush_batch_writers)
+        logger.info("ChatServer drained")
+
+
+def create_app() -> ChatServer:
+    """Build the server from the environment.
+
+    Serves every tenant in TENANTS_CONFIG when it is set, otherwise a single
+    agent configured by the usual variables. Run with e.g.
+    `uvicorn rag_chat_agent.server:create_app --factory`.
+    """
+    workers = int(os.getenv("SERVER_WORKERS") or 8)
+    max_queue = int(os.getenv("SERVER_MAX_QUEUE") or 32)
+    max_per_session = int(os.getenv("SERVER_MAX_PER_SESSION") or 4)
+
+    if os.getenv("TENANTS_CONFIG"):
+        from .registry import AgentRegistry
+
+        registry = AgentRegistry.from_env()
+        get_agent = registry.get_agent
+    else:
+        from .agent import RAGChatAgent
+
+        agent = RAGChatAgent()
+
+        def get_agent(tenant_id):
+            if tenant_id != DEFAULT_TENANT:
+                raise KeyError(tenant_id)
+            return agent
+
+    return ChatServer(
+        get_agent,
+        workers=workers,
+        max_queue=max_queue,
+        max_per_session=max_per_session,
+    )
@@ -6,13 +6,11 @@ from .safer_repl import SaferREPL
 
 logger = logging.getLogger(__name__)
 
-SaferREPL()
-
 
 class PythonREPLTool:
-    def __init__(self):
+    def __init__(self, sandbox=None):
         logger.info("Initialising PythonREPLTool")
-        self.repl = SaferREPL()
+        self.repl = SaferREPL(sandbox=sandbox)
         logger.debug("Underlying SaferREPL instance created")
 
         self.tool = StructuredTool.from_function(
@@ -1,5 +1,7 @@
+import json
 import logging
 import uuid
+import zlib
 from datetime import datetime
 
 from langchain_core.messages import messages_to_dict
@@ -25,27 +27,21 @@ class RatingTool:
             f"Rating conversation for session {self.dynamodb.tokenID}_{rating_uuid}."
         )
         try:
-            conversation_history = self.dynamodb.get_chat_history(self.dynamodb.tokenID)
-            conversation_content = conversation_history.messages
-            conversation_str = messages_to_dict(conversation_content)
-            logger.debug(
-                f"Retrieved conversation history for session {self.dynamodb.tokenID}_{rating_uuid}."
-            )
-
             item = {
                 "ratingID": f"{self.dynamodb.tokenID}_{rating_uuid}",
                 "sessionID": self.dynamodb.tokenID,
                 "timestamp": int(datetime.now().strftime("%Y%m%d%H%M%S")),
                 "rating": rating_string,
-                "conversation_history": conversation_str,
             }
             logger.debug(
                 f"Prepared rating item for DynamoDB {self.dynamodb.tokenID}_{rating_uuid}."
             )
 
-            self.dynamodb.put_item(self.dynamodb.rating_history_table, item)
+            self.dynamodb.put_item_async(
+                self.dynamodb.rating_history_table, item, self._add_conversation
+            )
             logger.info(
-                f"Successfully rated conversation for session {self.dynamodb.tokenID}_{rating_uuid}."
+                f"Queued rating for session {self.dynamodb.tokenID}_{rating_uuid}."
             )
             return f"Conversation successfully rated for session {self.dynamodb.tokenID}_{rating_uuid}."
         except Exception as e:
@@ -54,6 +50,19 @@ class RatingTool:
             )
             return f"Failed to rate conversation for session {self.dynamodb.tokenID}. An Error was raised by the tool."
 
+    def _add_conversation(self, item: dict) -> dict:
+        """Attach the conversation being rated, as zlib compressed JSON bytes.
+
+        Runs on the batch writer's thread, so reading the history stays off the
+        request path. The rating turn itself is saved once the turn ends, so
+        the snapshot usually excludes it, but may include it if the write
+        happens later.
+        """
+        history = self.dynamodb.get_chat_history(item["sessionID"])
+        conversation = json.dumps(messages_to_dict(history.messages))
+        item["conversation_history"] = zlib.compress(conversation.encode("utf-8"))
+        return item
+
     def get_tool(self):
         logger.debug("Returning RatingTool")
         return self.tool
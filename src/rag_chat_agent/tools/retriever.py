@@ -1,16 +1,159 @@
-from langchain.tools.retriever import create_retriever_tool
-
+import json
 import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, List
+
+from langchain.tools.retriever import create_retriever_tool
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 
 logger = logging.getLogger(__name__)
 
+_WORD = re.compile(r"\w+")
+
+_turn_memo: ContextVar[dict | None] = ContextVar("turn_memo", default=None)
+
+
+def normalise_query(query: str) -> str:
+    """Lower case words only, so trivially reworded queries share a key."""
+    return " ".join(_WORD.findall(query.casefold()))
+
+
+@contextmanager
+def turn_memo():
+    """Remember retriever results for the rest of the agent turn."""
+    token = _turn_memo.set({})
+    try:
+        yield
+    finally:
+        _turn_memo.reset(token)
+
+
+class RetrievalCache:
+    """Thread safe LRU cache whose entries expire after `ttl` seconds.
+
+    Entries are stored with the index version they were read at and are
+    treated as misses once the version changes.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple, version: str | None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires_at, entry_version, value = entry
+                if expires_at > time.monotonic() and entry_version == version:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, version: str | None, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, version, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+@lru_cache(maxsize=None)
+def get_retrieval_cache(max_size: int, ttl: float) -> RetrievalCache:
+    """Return the process-wide cache, shared by every agent in the process."""
+    return RetrievalCache(max_size=max_size, ttl=ttl)
+
+
+class CachedRetriever(BaseRetriever):
+    """Wraps a retriever with per-turn memoisation and a shared TTL cache.
+
+    Within a turn (see `turn_memo`) a repeated query is answered from memory.
+    Across turns, results are shared through `cache`, keyed by `namespace`,
+    the normalised query and the search arguments, for as long as the
+    index version reported by `index_version` stays the same.
+    """
+
+    retriever: BaseRetriever
+    namespace: tuple
+    search_kwargs: dict = {}
+    cache: Any = None
+    index_version: Any = None
+
+    def _key(self, query: str) -> tuple:
+        k = self.search_kwargs.get("k")
+        filters = {key: v for key, v in self.search_kwargs.items() if key != "k"}
+        return (
+            *self.namespace,
+            query,
+            k,
+            json.dumps(filters, sort_keys=True, default=str),
+        )
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        normalised = normalise_query(query)
+        memo = _turn_memo.get()
+        if memo is not None and normalised in memo:
+            logger.debug(f"Retriever turn memo hit for '{normalised}'")
+            return list(memo[normalised])
+
+        documents = None
+        if self.cache is not None:
+            key = self._key(normalised)
+            version = self.index_version.get() if self.index_version else None
+            documents = self.cache.get(key, version)
+            if documents is not None:
+                logger.debug(f"Retriever cache hit for '{normalised}'")
+
+        if documents is None:
+            documents = self.retriever.invoke(
+                query, config={"callbacks": run_manager.get_child()}
+            )
+            if self.cache is not None:
+                self.cache.put(key, version, documents)
+
+        if memo is not None:
+            memo[normalised] = documents
+        return list(documents)
+
 
 class RetrieverTool:
-    def __init__(self, opensearch):
+    def __init__(self, opensearch, cache_ttl: float = 0, cache_size: int = 1024):
         logger.info("Initializing RetrieverTool")
         try:
-            self.retriever = opensearch.get_retriever()
+            retriever = opensearch.get_retriever()
             logger.info("Successfully created retriever")
+            cache = None
+            index_version = None
+            if cache_ttl > 0:
+                cache = get_retrieval_cache(cache_size, cache_ttl)
+                index_version = opensearch.get_index_version()
+            self.retriever = CachedRetriever(
+                retriever=retriever,
+                namespace=(opensearch.url, opensearch.index_name),
+                search_kwargs=retriever.search_kwargs,
+                cache=cache,
+                index_version=index_version,
+            )
             self.tool = create_retriever_tool(
                 retriever=self.retriever,
                 name="guidance-retriever",
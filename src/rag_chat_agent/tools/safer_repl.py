@@ -1,8 +1,12 @@
+import ast
 import logging
 import os
 import platform
 import re
 import signal
+import textwrap
+from functools import lru_cache
+from types import CodeType
 from typing import Any, Dict
 
 SAFE_GLOBALS = {
@@ -46,13 +50,141 @@ SAFE_GLOBALS = {
     "tuple": tuple,
     "type": type,
     "zip": zip,
+    "print": print,
+    "ArithmeticError": ArithmeticError,
+    "Exception": Exception,
+    "IndexError": IndexError,
+    "KeyError": KeyError,
+    "OverflowError": OverflowError,
+    "TypeError": TypeError,
+    "ValueError": ValueError,
+    "ZeroDivisionError": ZeroDivisionError,
 }
+"""the only builtins snippets can see, exec adds the real ones unless told otherwise"""
+
+
+DISALLOWED_NAMES = {
+    "breakpoint",
+    "compile",
+    "delattr",
+    "eval",
+    "exec",
+    "exit",
+    "getattr",
+    "globals",
+    "help",
+    "input",
+    "locals",
+    "open",
+    "quit",
+    "setattr",
+    "vars",
+}
+"""builtins snippets have no business calling, refused before they run"""
+
+INTROSPECTION_ATTRIBUTES = {
+    "ag_await",
+    "ag_code",
+    "ag_frame",
+    "cr_await",
+    "cr_code",
+    "cr_frame",
+    "gi_code",
+    "gi_frame",
+    "gi_yieldfrom",
+    "tb_frame",
+    "tb_next",
+}
+"""generator, coroutine and traceback attributes that lead to frames and code"""
+
+INTROSPECTION_PREFIXES = ("f_", "co_")
+"""frame and code object attributes, e.g. f_builtins and co_consts"""
+
+_LEADING_FENCE = re.compile(r"^(\s|`)*(?i:python)?\s*")
+_TRAILING_FENCE = re.compile(r"(\s|`)*$")
 
 
 class TimeoutException(Exception):
     pass
 
 
+class DisallowedCodeError(Exception):
+    """Raised when a snippet uses a construct the REPL refuses to run."""
+
+
+class _SnippetValidator(ast.NodeVisitor):
+    """Walks a parsed snippet and raises DisallowedCodeError on the first bad node."""
+
+    def _reject(self, node, reason):
+        raise DisallowedCodeError(f"{reason} (line {getattr(node, 'lineno', '?')})")
+
+    def visit_Import(self, node):
+        self._reject(node, "Imports are not allowed")
+
+    def visit_ImportFrom(self, node):
+        self._reject(node, "Imports are not allowed")
+
+    def visit_Global(self, node):
+        self._reject(node, "global statements are not allowed")
+
+    def visit_Nonlocal(self, node):
+        self._reject(node, "nonlocal statements are not allowed")
+
+    def visit_Attribute(self, node):
+        if (
+            node.attr.startswith("__")
+            or node.attr.startswith(INTROSPECTION_PREFIXES)
+            or node.attr in INTROSPECTION_ATTRIBUTES
+        ):
+            self._reject(node, f"Access to '{node.attr}' is not allowed")
+        if node.attr in ("format", "format_map"):
+            # Format fields can look up attributes ("{0.__class__}"), so the
+            # template must be a literal we can check.
+            template = node.value
+            if not (
+                isinstance(template, ast.Constant) and isinstance(template.value, str)
+            ):
+                self._reject(node, f"'{node.attr}' is only allowed on a string literal")
+            if "__" in template.value:
+                self._reject(node, "Format strings may not contain '__'")
+        self.generic_visit(node)
+
+    def visit_Name(self, node):
+        if node.id.startswith("__") or node.id in DISALLOWED_NAMES:
+            self._reject(node, f"Use of '{node.id}' is not allowed")
+
+
+def normalise_snippet(code_string: str) -> str:
+    """Strip code fences and indentation the LLM may wrap a snippet in."""
+    code_string = _LEADING_FENCE.sub("", textwrap.dedent(code_string))
+    code_string = _TRAILING_FENCE.sub("", code_string)
+    return "\n".join(line.rstrip() for line in code_string.splitlines())
+
+
+@lru_cache(maxsize=256)
+def _compile_normalised(source: str) -> tuple[CodeType | None, type | None, str]:
+    # Failures are cached too, as the agent tends to retry the same snippet.
+    try:
+        tree = ast.parse(source, filename="<repl>", mode="exec")
+        _SnippetValidator().visit(tree)
+        return compile(tree, "<repl>", "exec"), None, ""
+    except (SyntaxError, DisallowedCodeError) as e:
+        return None, type(e), str(e)
+
+
+def compile_snippet(code_string: str) -> CodeType:
+    """Validate and compile a snippet, reusing the code object for repeats.
+
+    Raises:
+        SyntaxError: if the snippet doesn't parse.
+        DisallowedCodeError: if the snippet uses a disallowed construct.
+    """
+    code, error_type, message = _compile_normalised(normalise_snippet(code_string))
+    if error_type is not None:
+        raise error_type(message)
+    return code
+
+
 class SaferREPL:
     """Simulates a standalone Python REPL.
 
@@ -62,15 +194,20 @@ class SaferREPL:
     'return and input as a string assigned to "result"'
 
     Works in a lambda as it used no mutliprocessing. It also attempts to be slightly
-    safer by limiting exec to a list of globals and an empty name space.
+    safer by limiting exec to a list of globals and an empty name space. Snippets are
+    parsed and checked for imports, dunder access and dangerous builtins before they
+    run, and compiled code is cached so repeated calculations skip the compile.
 
-    Doesn't work in non-unix envs due to the use of signal.
+    Doesn't work in non-unix envs due to the use of signal. signal.alarm also only
+    works on the main thread, so pass a SandboxPool (see sandbox.py) to run code in
+    worker processes instead when serving from threads.
     """
 
-    def __init__(self, timeout=1):
+    def __init__(self, timeout=1, sandbox=None):
         logging.info("Launching SafeREPL")
         self.ensure_unix_environment()
         self.timeout = timeout
+        self.sandbox = sandbox
 
     @staticmethod
     def ensure_unix_environment():
@@ -94,17 +231,27 @@ class SaferREPL:
         Returns:
             str: The sanitized query
         """
-        query = re.sub(r"^(\s|`)*(?i:python)?\s*", "", query)
-        query = re.sub(r"(\s|`)*$", "", query)
+        query = _LEADING_FENCE.sub("", query)
+        query = _TRAILING_FENCE.sub("", query)
         logging.info(f"Sanitized query: {query}")
         return query
 
+    @staticmethod
+    def check(code_string) -> str | None:
+        """Return an error string if the snippet would be refused, otherwise None."""
+        try:
+            compile_snippet(code_string)
+        except (SyntaxError, DisallowedCodeError) as e:
+            return f"Error: {str(e)}"
+        return None
+
     def _execute_in_restricted_environment(self, code_string: str) -> Dict[str, Any]:
-        # Create a safe globals dictionary
+        code = compile_snippet(code_string)
 
-        # give the exec no access to local variables.
+        # give the exec no access to local variables, and only the safe builtins.
+        # A fresh copy each time, as snippets can rebind the names in it.
         namespace_for_exec = {}
-        exec(code_string, SAFE_GLOBALS, namespace_for_exec)
+        exec(code, {"__builtins__": dict(SAFE_GLOBALS)}, namespace_for_exec)
         logging.debug("namespace_for_exec after exec: {print(namespace_for_exec)}")
         return namespace_for_exec
 
@@ -115,9 +262,36 @@ class SaferREPL:
             'No valid output returned, the output must be a string assigned to "result"'
         )
 
+    def execute(self, code_string):
+        """Run code without a timeout, returning the result or an error string.
+
+        Timeouts are enforced by the caller, either `run` or a sandbox worker.
+        """
+        try:
+            namespace_for_exec = self._execute_in_restricted_environment(code_string)
+            if isinstance(namespace_for_exec, dict):
+                return self._check_result(namespace_for_exec)
+        except TimeoutException:
+            raise
+        except NameError as e:
+            return f"Error: {str(e)}"
+        except SyntaxError as e:
+            return f"Error: {str(e)}"
+        except DisallowedCodeError as e:
+            return f"Error: {str(e)}"
+        except Exception as e:
+            return f"Error: An unexpected error occurred: {str(e)}"
+
     def run(self, code_string):
         logging.info(f"Running in REPL: {code_string}")
 
+        if self.sandbox is not None:
+            # Refuse bad snippets here rather than a round trip to a worker.
+            error = self.check(code_string)
+            if error:
+                return error
+            return self.sandbox.run(code_string)
+
         def timeout_handler(signum, frame):
             raise TimeoutException()
 
@@ -128,34 +302,57 @@ class SaferREPL:
         signal.alarm(self.timeout)
 
         try:
-            namespace_for_exec = self._execute_in_restricted_environment(code_string)
-            if isinstance(namespace_for_exec, dict):
-                return self._check_result(namespace_for_exec)
+            return self.execute(code_string)
         except TimeoutException:
             return "Error: Execution timed out"
-        except NameError as e:
-            return f"Error: {str(e)}"
-        except SyntaxError as e:
-            return f"Error: {str(e)}"
-        except Exception as e:
-            return f"Error: An unexpected error occurred: {str(e)}"
         finally:
             signal.alarm(0)
 
 
 def main():
-    repl = SaferREPL(timeout=5)
-    assert repl.run("import time\ntime.sleep(2)\nresult='pass'") == "pass"
+    repl = SaferREPL(timeout=2)
+    assert repl.run("result='pass'") == "pass"
+    assert repl.run("```python\n    result = sum(range(5))\n```") == "10"
     assert (
-        repl.run("import time\ntime.sleep(2)\nnot_result='pass'")
+        repl.run("not_result='pass'")
         == 'No valid output returned, the output must be a string assigned to "result"'
     )
     assert (
-        repl.run("import time\ntime.sleep(6)\nresult='pass'")
-        == "Error: Execution timed out"
+        repl.run("while True:\n    pass\nresult='pass'") == "Error: Execution timed out"
+    )
+    assert repl.run("import time\nresult='pass'").startswith(
+        "Error: Imports are not allowed"
+    )
+    assert repl.run("result = ().__class__").startswith("Error: Access to '__class__'")
+    assert repl.run("result = open('x')").startswith("Error: Use of 'open'")
+    assert repl.run("result = '{:.1f}'.format(2.25)") == "2.2"
+    assert repl.run("result = '{0.__class__}'.format(())").startswith(
+        "Error: Format strings may not contain '__'"
+    )
+    assert repl.run("s = '{0.__class__}'\nresult = s.format(())").startswith(
+        "Error: 'format' is only allowed on a string literal"
+    )
+    assert repl.run("result = str.format_map('{x}', {'x': 1})").startswith(
+        "Error: 'format_map' is only allowed on a string literal"
+    )
+    assert repl.run(
+        "b = (x for x in [1]).gi_frame.f_builtins\n"
+        "result = b['__im' + 'port__']('os').getcwd()"
+    ).startswith("Error: Access to 'f_builtins'")
+    # Even past the validator, the frame only leads to the safe builtins.
+    namespace = {}
+    exec(
+        "b = (x for x in [1])\nresult = '__import__' in getattr(b, 'gi_frame').f_builtins",
+        {"__builtins__": {**SAFE_GLOBALS, "getattr": getattr}},
+        namespace,
+    )
+    assert namespace["result"] is False
+    assert repl.run("result = sum(x for x in range(5))") == "10"
+    assert (
+        repl.run("try:\n    1 / 0\nexcept ZeroDivisionError:\n    result = 'inf'")
+        == "inf"
     )
     # TODO add some more assert to check other cases
-    # TODO move these to an actual test suite.
 
 
 if __name__ == "__main__":
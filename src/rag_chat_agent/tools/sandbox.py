@@ -0,0 +1,194 @@
+import atexit
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import resource
+import threading
+
+from .safer_repl import SaferREPL
+
+logger = logging.getLogger(__name__)
+
+
+def _current_address_space() -> int:
+    """Bytes of virtual memory the current process is already using."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _limit_resources(cpu_limit: int, max_tasks: int, memory_limit: int):
+    # Workers inherit the serving process's environment, which holds the AWS
+    # credentials in Lambda. Snippets have no use for any of it.
+    os.environ.clear()
+
+    # Point stdio at /dev/null while we can still open files, so snippets that
+    # print don't write into the parent's logs.
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.close(devnull)
+
+    # The hard CPU limit covers the worker's whole life. The soft limit is
+    # moved forward before each task, see _worker_loop.
+    hard_cpu = cpu_limit * max_tasks + 1
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_limit, hard_cpu))
+
+    if memory_limit:
+        limit = _current_address_space() + memory_limit
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    # Existing descriptors (our pipe) keep working, no new ones can be opened.
+    resource.setrlimit(resource.RLIMIT_NOFILE, (0, 0))
+
+
+def _worker_loop(conn, cpu_limit: int, max_tasks: int, memory_limit: int):
+    """Entry point of a sandbox worker process."""
+    _limit_resources(cpu_limit, max_tasks, memory_limit)
+    repl = SaferREPL()
+    while True:
+        try:
+            code_string = conn.recv()
+        except EOFError:
+            return
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used = math.ceil(usage.ru_utime + usage.ru_stime)
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        resource.setrlimit(resource.RLIMIT_CPU, (min(used + cpu_limit, hard), hard))
+        conn.send(repl.execute(code_string))
+
+
+class _Worker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.tasks = 0
+
+    def stop(self):
+        self.conn.close()
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+
+
+class SandboxPool:
+    """Pool of pre-forked, resource limited processes for running SaferREPL code.
+
+    Workers are started from a multiprocessing fork server, so they never
+    inherit the serving process's threads or sockets and new workers can be
+    started safely from any thread. The environment, and with it any
+    credentials, is cleared before a worker runs code. Each worker is limited
+    with setrlimit to `cpu_limit` seconds of CPU per task, `memory_limit`
+    extra bytes of address space and no new file descriptors.
+
+    The timeout is enforced from the parent: a worker that doesn't answer
+    in time is killed and replaced, leaving the calling thread unharmed.
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        timeout: float = 1,
+        cpu_limit: int | None = None,
+        memory_limit: int = 256 * 1024 * 1024,
+        max_tasks: int = 100,
+        acquire_timeout: float = 10,
+    ):
+        logger.info(f"Starting SandboxPool with {size} workers")
+        self.size = size
+        self.timeout = timeout
+        self.cpu_limit = cpu_limit or math.ceil(timeout)
+        self.memory_limit = memory_limit
+        self.max_tasks = max_tasks
+        self.acquire_timeout = acquire_timeout
+
+        self.ctx = multiprocessing.get_context("forkserver")
+        self.ctx.set_forkserver_preload([__name__])
+        self.idle = queue.Queue()
+        self.workers = set()
+        self.lock = threading.Lock()
+        self.closed = False
+
+        for _ in range(size):
+            self.idle.put(self._start_worker())
+
+    def _start_worker(self) -> _Worker:
+        parent_conn, child_conn = self.ctx.Pipe()
+        process = self.ctx.Process(
+            target=_worker_loop,
+            args=(child_conn, self.cpu_limit, self.max_tasks, self.memory_limit),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        worker = _Worker(process, parent_conn)
+        with self.lock:
+            self.workers.add(worker)
+        logger.debug(f"Started sandbox worker {process.pid}")
+        return worker
+
+    def _retire(self, worker: _Worker):
+        with self.lock:
+            self.workers.discard(worker)
+        worker.stop()
+        if not self.closed:
+            self.idle.put(self._start_worker())
+
+    def run(self, code_string: str) -> str:
+        if self.closed:
+            raise RuntimeError("SandboxPool has been closed")
+        try:
+            worker = self.idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            logger.warning("No sandbox worker became free in time")
+            return "Error: The Python sandbox is busy, try again later"
+
+        try:
+            worker.conn.send(code_string)
+            if not worker.conn.poll(self.timeout):
+                logger.warning(f"Sandbox worker {worker.process.pid} timed out")
+                self._retire(worker)
+                return "Error: Execution timed out"
+            result = worker.conn.recv()
+        except (EOFError, OSError):
+            # Killed by a resource limit, most likely CPU or memory.
+            logger.warning(
+                f"Sandbox worker {worker.process.pid} exited with code "
+                f"{worker.process.exitcode}"
+            )
+            self._retire(worker)
+            return "Error: Execution exceeded the sandbox's resource limits"
+
+        worker.tasks += 1
+        if worker.tasks >= self.max_tasks:
+            self._retire(worker)
+        else:
+            self.idle.put(worker)
+        return result
+
+    def close(self):
+        logger.info("Closing SandboxPool")
+        self.closed = True
+        with self.lock:
+            workers = list(self.workers)
+            self.workers.clear()
+        for worker in workers:
+            worker.stop()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_sandbox_pool(size: int = 2, timeout: float = 1) -> SandboxPool:
+    """Return the process-wide SandboxPool, starting it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool(size=size, timeout=timeout)
+            atexit.register(_pool.close)
+        return _pool
@@ -0,0 +1,58 @@
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+from rag_chat_agent.aws.resilience import (
+    CircuitBreaker,
+    DeadlineExceededError,
+    ResilientCaller,
+    turn_deadline,
+)
+
+
+def throttle():
+    raise ClientError({"Error": {"Code": "ThrottlingException"}}, "Invoke")
+
+
+def interrupt():
+    raise KeyboardInterrupt
+
+
+@pytest.fixture
+def caller():
+    # Opens on the first failure, and lets a probe through 0.1s later.
+    return ResilientCaller(
+        "test",
+        max_rate=1,
+        burst=1,
+        max_attempts=1,
+        failure_threshold=1,
+        reset_timeout=0.1,
+    )
+
+
+def test_deadline_waiting_for_rate_limit_leaves_breaker_open(caller):
+    with pytest.raises(ClientError):
+        caller.call(throttle)
+    assert caller.breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.2)
+    with pytest.raises(DeadlineExceededError), turn_deadline(0.01):
+        caller.call(lambda: "unreachable")
+    assert caller.breaker.state == CircuitBreaker.OPEN
+
+    assert caller.call(lambda: "pass") == "pass"
+    assert caller.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_interrupted_probe_leaves_breaker_open(caller):
+    caller.breaker.record_failure()
+    time.sleep(0.2)
+
+    with pytest.raises(KeyboardInterrupt):
+        caller.call(interrupt)
+    assert caller.breaker.state == CircuitBreaker.OPEN
+
+    assert caller.call(lambda: "pass") == "pass"
+    assert caller.breaker.state == CircuitBreaker.CLOSED